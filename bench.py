@@ -0,0 +1,235 @@
+"""
+Encode/decode throughput benchmark.
+
+Runs encode_data() and decode_data() over a grid of (k, p), shard sizes,
+encoding matrix types and coding engines, and reports MB/s of data shards
+processed together with per-call latency percentiles.  The engines are the
+table lookup ErasureCode, the XOR-only BitMatrixCode (Cauchy only) and the
+LocalReconstructionCode, whose codes are given as k+l+g.  The repair of a
+single lost shard is also timed, and the average number of shards read to
+repair one lost shard is reported as the repair bandwidth.  Results are
+printed as a table and can be written as JSON to track
+regressions between releases:
+
+    python bench.py --json results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+from bitmatrix import BitMatrixCode
+from erasure_code import ErasureCode
+from lrc import LocalReconstructionCode
+
+DEFAULT_CODES = ['4+2', '8+3', '10+4', '16+4', '12+2+2']
+DEFAULT_SIZES = ['4K', '64K', '1M', '16M', '64M']
+DEFAULT_MATRICES = ['cauchy', 'rs', 'vandermonde']
+DEFAULT_ENGINES = ['table']
+
+ENGINES = ['table', 'bitmatrix', 'lrc']
+
+SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(text[:-1]) * SIZE_SUFFIXES[text[-1]]
+    return int(text)
+
+
+def parse_code(text):
+    """Parses k+p, or k+l+g for local reconstruction codes."""
+    return tuple(int(part) for part in text.split('+'))
+
+
+def percentile(sorted_vals, pct):
+    """Nearest rank percentile of an already sorted list."""
+    idx = int(round(pct / 100.0 * (len(sorted_vals) - 1)))
+    return sorted_vals[idx]
+
+
+def time_calls(func, min_time, min_iters, max_iters):
+    """Calls func repeatedly and returns the list of call durations.
+
+    Runs at least min_iters times and keeps going until min_time seconds have
+    been spent, or max_iters calls were made.
+    """
+    times = []
+    total = 0.0
+    while len(times) < max_iters:
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+
+        times.append(elapsed)
+        total += elapsed
+        if len(times) >= min_iters and total >= min_time:
+            break
+    return times
+
+
+def summarize(times, nbytes):
+    times = sorted(times)
+    total = sum(times)
+    return {
+        'iterations': len(times),
+        'mb_per_s': nbytes * len(times) / total / (1 << 20) if total else None,
+        'latency_s': {
+            'min': times[0],
+            'p50': percentile(times, 50),
+            'p90': percentile(times, 90),
+            'p99': percentile(times, 99),
+            'max': times[-1],
+        },
+    }
+
+
+def make_codec(engine, code, matrix):
+    if engine == 'lrc':
+        if len(code) != 3:
+            raise ValueError('lrc engine requires a k+l+g code')
+        return LocalReconstructionCode(*code, matrix=matrix)
+
+    if len(code) != 2:
+        raise ValueError('{} engine requires a k+p code'.format(engine))
+    if engine == 'bitmatrix':
+        if matrix != 'cauchy':
+            raise ValueError('bitmatrix engine only supports cauchy')
+        return BitMatrixCode(*code)
+    return ErasureCode(*code, matrix=matrix)
+
+
+def repair_reads(ec, lost):
+    """Returns the number of shards read to rebuild the lost shards."""
+    if isinstance(ec, LocalReconstructionCode):
+        return len(ec.repair_sources(lost))
+    return ec.k
+
+
+def bench_one(code, matrix, engine, shard_size, args):
+    """Benchmarks encode, decode and repair for one configuration.
+
+    returns: list of result dicts, one per operation
+    """
+    base = {'code': '+'.join(map(str, code)), 'k': code[0],
+            'p': sum(code[1:]), 'matrix': matrix, 'engine': engine,
+            'shard_size': shard_size}
+    try:
+        ec = make_codec(engine, code, matrix)
+    except ValueError as e:
+        return [dict(base, op='encode', error=str(e))]
+
+    k = ec.k
+    data = [os.urandom(shard_size) for _ in xrange(k)]
+    nbytes = k * shard_size
+    results = []
+
+    times = time_calls(lambda: ec.encode_data(data),
+                       args.min_time, args.min_iters, args.max_iters)
+    results.append(dict(base, op='encode', **summarize(times, nbytes)))
+
+    all_shards = dict(enumerate(data + map(str, ec.encode_data(data))))
+
+    # Repair of a single lost data shard, the common case
+    shards = dict(all_shards)
+    del shards[0]
+    times = time_calls(lambda: ec.decode_data(shards, [0]),
+                       args.min_time, args.min_iters, args.max_iters)
+    reads = [repair_reads(ec, [i]) for i in xrange(ec.n)]
+    results.append(dict(base, op='repair', lost=[0],
+                        repair_read_bytes=repair_reads(ec, [0]) * shard_size,
+                        avg_repair_reads=float(sum(reads)) / len(reads),
+                        **summarize(times, shard_size)))
+
+    # Lose as many data shards as possible, the worst case for decode.  The
+    # global parities of an LRC only cover g of them.
+    shards = dict(all_shards)
+    lost = range(min(k, code[-1]))
+    for i in lost:
+        del shards[i]
+
+    try:
+        ec.decode_data(shards)
+    except ValueError as e:
+        results.append(dict(base, op='decode', lost=lost, error=str(e)))
+        return results
+
+    times = time_calls(lambda: ec.decode_data(shards),
+                       args.min_time, args.min_iters, args.max_iters)
+    results.append(dict(base, op='decode', lost=lost,
+                        **summarize(times, nbytes)))
+
+    return results
+
+
+def print_result(res):
+    name = ('{code:<8} {matrix:<11} {engine:<9} {shard_size:>10} '
+            '{op:<7}'.format(**res))
+    if 'error' in res:
+        print '{} error: {}'.format(name, res['error'])
+        return
+
+    lat = res['latency_s']
+    line = '{} {:10.1f} MB/s  p50 {:9.3f}ms  p99 {:9.3f}ms  ({} calls)'.format(
+        name, res['mb_per_s'], lat['p50'] * 1e3, lat['p99'] * 1e3,
+        res['iterations'])
+    if 'avg_repair_reads' in res:
+        line += '  reads {:.2f} shards/repair'.format(res['avg_repair_reads'])
+    print line
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--codes', nargs='+', default=DEFAULT_CODES,
+                        help='k+p combinations, e.g. 10+4, or k+l+g for '
+                             'the lrc engine, e.g. 12+2+2')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help='shard sizes, e.g. 4K 1M')
+    parser.add_argument('--matrices', nargs='+', default=DEFAULT_MATRICES,
+                        choices=sorted(ErasureCode.matrix_gens))
+    parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES,
+                        choices=ENGINES)
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='minimum seconds to run each measurement')
+    parser.add_argument('--min-iters', type=int, default=3)
+    parser.add_argument('--max-iters', type=int, default=1000)
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args(argv)
+
+    results = []
+    for code in args.codes:
+        code = parse_code(code)
+        for matrix in args.matrices:
+            for engine in args.engines:
+                if (engine == 'lrc') != (len(code) == 3):
+                    continue
+                for size in args.sizes:
+                    for res in bench_one(code, matrix, engine,
+                                         parse_size(size), args):
+                        print_result(res)
+                        results.append(res)
+
+    if args.json:
+        report = {
+            'meta': {
+                'date': datetime.datetime.utcnow().isoformat() + 'Z',
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': vars(args),
+            },
+            'results': results,
+        }
+        with open(args.json, 'wb') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
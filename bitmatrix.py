@@ -0,0 +1,262 @@
+"""
+XOR-only Cauchy Reed-Solomon coding.
+
+Each GF(2^8) coefficient e of the Cauchy matrix is expanded into the 8 x 8
+binary matrix of x -> e * x, turning the p x k encoding matrix into an
+8p x 8k bit-matrix.  Every shard is split into 8 packets, and each parity
+packet is the XOR of the data packets selected by its row of the bit-matrix.
+Packets are XOR-ed as whole Python longs, so there are no table lookups at
+all.
+
+The XOR-s for a bit-matrix are planned once into a schedule that computes
+sums of packets shared by several rows only once, see xor_schedule().
+
+The parity produced is that of the bit-sliced code and differs from
+ErasureCode.encode_data() on the same input, so shards must be decoded with
+the same engine that encoded them.
+"""
+import heapq
+
+from decode_cache import DecodeMatrixCache
+from erasure_code import ErasureCode
+import gf_vect
+
+# Bits per GF(2^8) symbol, and so packets per shard
+W = 8
+
+
+def bitmatrix_gen(gf, mat):
+    """Expands a GF(2^8) matrix into its bit-matrix.
+
+    mat: list of rows of GF(2^8) elements
+
+    returns: list of 8 * len(mat) rows, each a list of 8 * len(mat[0]) bits
+    """
+    res = []
+    for row in mat:
+        # cols[c][j] holds e * x^j for element c of the row
+        cols = [[gf.mult(e, 1 << j) for j in xrange(W)] for e in row]
+        for i in xrange(W):
+            res.append([(prods[j] >> i) & 1 for prods in cols
+                        for j in xrange(W)])
+    return res
+
+
+def xor_schedule(bitmatrix):
+    """Plans the XOR-s to compute every row of a bit-matrix.
+
+    Greedily picks the pair of inputs that appears together in the most rows,
+    computes its sum once as a new intermediate term and substitutes it in
+    those rows, until no pair is shared by two or more rows.
+
+    returns: (temps, rows) where temps is a list of (a, b) term pairs.  Term
+             numbers below the number of bit-matrix columns are inputs, and
+             temp i is term number cols + i.  rows is a list of the terms to
+             XOR for each row.
+    """
+    num_cols = len(bitmatrix[0]) if bitmatrix else 0
+    rows = [set(c for c, bit in enumerate(row) if bit) for row in bitmatrix]
+    temps = []
+
+    # Number of rows each pair of terms appears in, with a heap of
+    # (-count, pair) entries to find the most common pair.  Heap entries
+    # are not removed when a count changes, stale ones are skipped instead.
+    counts = {}
+    heap = []
+
+    def adjust(a, b, delta):
+        pair = (a, b) if a < b else (b, a)
+        count = counts.get(pair, 0) + delta
+        counts[pair] = count
+        if count >= 2:
+            heapq.heappush(heap, (-count, pair))
+
+    for terms in rows:
+        terms_list = sorted(terms)
+        for i, a in enumerate(terms_list):
+            for b in terms_list[i + 1:]:
+                counts[a, b] = counts.get((a, b), 0) + 1
+
+    heap = [(-count, pair) for pair, count in counts.iteritems() if count >= 2]
+    heapq.heapify(heap)
+
+    while heap:
+        neg_count, pair = heapq.heappop(heap)
+        if -neg_count != counts[pair]:
+            continue
+
+        a, b = pair
+        term = num_cols + len(temps)
+        temps.append(pair)
+        for terms in rows:
+            if a not in terms or b not in terms:
+                continue
+
+            terms.difference_update(pair)
+            adjust(a, b, -1)
+            for x in terms:
+                adjust(a, x, -1)
+                adjust(b, x, -1)
+                adjust(term, x, 1)
+            terms.add(term)
+
+    return temps, [sorted(terms) for terms in rows]
+
+
+def schedule_xors(schedule):
+    """Returns the number of packet XOR-s a schedule performs."""
+    temps, rows = schedule
+    return len(temps) + sum(max(len(terms) - 1, 0) for terms in rows)
+
+
+class BitMatrixCode:
+    def __init__(self, k, p, packet_size=None, cache_size=64):
+        """Sets up XOR-only encoding and decoding with a Cauchy bit-matrix.
+
+        k:           number of data shards
+        p:           number of parity shards
+        packet_size: bytes per packet.  Shards are processed as blocks of
+                     8 packets, so their length must be a multiple of
+                     8 * packet_size.  None uses one block per shard.
+        cache_size:  number of decode schedules to keep cached
+        """
+        self.ec = ErasureCode(k, p, cache_size, matrix='cauchy')
+        self.k = k
+        self.p = p
+        self.n = k + p
+        self.packet_size = packet_size
+
+        self.encode_bitmatrix = bitmatrix_gen(self.ec.gf,
+                                              self.ec.encoding_matrix[k:])
+        self.encode_schedule = xor_schedule(self.encode_bitmatrix)
+
+        self.schedule_cache = DecodeMatrixCache(cache_size)
+
+    def packets(self, buf, length):
+        """Returns the 8 packets of buf, each as a long.
+
+        With a packet size, packet j is made of packet j of every block.
+        """
+        buf = gf_vect.as_bytes(buf)
+        if self.packet_size is None:
+            size = length // W
+            return [gf_vect.to_long(buf[j * size:(j + 1) * size])
+                    for j in xrange(W)]
+
+        ps = self.packet_size
+        block = W * ps
+        return [
+            gf_vect.to_long(''.join(buf[off + j * ps:off + (j + 1) * ps]
+                                    for off in xrange(0, length, block)))
+            for j in xrange(W)
+        ]
+
+    def unpackets(self, packets, length):
+        """Inverse of packets(), returns a bytearray of length bytes."""
+        if self.packet_size is None:
+            size = length // W
+            return bytearray(''.join(gf_vect.from_long(v, size)
+                                     for v in packets))
+
+        ps = self.packet_size
+        block = W * ps
+        per_packet = length // W
+        parts = [gf_vect.from_long(v, per_packet) for v in packets]
+
+        res = bytearray(length)
+        for j, part in enumerate(parts):
+            for b, off in enumerate(xrange(0, length, block)):
+                res[off + j * ps:off + (j + 1) * ps] = part[b * ps:(b + 1) * ps]
+        return res
+
+    def check_length(self, length):
+        unit = W * (self.packet_size or 1)
+        if length % unit:
+            msg = 'Shard length must be a multiple of {}, got {}.'
+            raise ValueError(msg.format(unit, length))
+
+    def run_schedule(self, schedule, srcs, length):
+        """Executes a schedule over the packets of srcs.
+
+        returns: list of output shards, one per 8 rows of the schedule
+        """
+        temps, rows = schedule
+
+        terms = []
+        for src in srcs:
+            terms.extend(self.packets(src, length))
+        for a, b in temps:
+            terms.append(terms[a] ^ terms[b])
+
+        outs = []
+        for r in xrange(0, len(rows), W):
+            packets = []
+            for row in rows[r:r + W]:
+                val = 0
+                for t in row:
+                    val ^= terms[t]
+                packets.append(val)
+            outs.append(self.unpackets(packets, length))
+        return outs
+
+    def encode_data(self, data):
+        """XOR-only counterpart of ErasureCode.encode_data()."""
+        if len(data) != self.k:
+            msg = (
+                'Expected {} data shards but {} were given.'
+                    .format(self.k, len(data))
+            )
+            raise ValueError(msg)
+
+        length = self.ec.check_buffers(data)
+        self.check_length(length)
+
+        return self.run_schedule(self.encode_schedule, data, length)
+
+    def decode_schedule(self, key):
+        """Builds the schedule rebuilding shards want from survivors."""
+        survivors, want = key
+        mat_inv = self.ec.decode_matrix(survivors)
+
+        rows = []
+        for i in want:
+            if i < self.k:
+                rows.append(mat_inv[i])
+            else:
+                rows.append(
+                    self.ec.matrix_mult([self.ec.encoding_matrix[i]],
+                                        mat_inv)[0])
+
+        return xor_schedule(bitmatrix_gen(self.ec.gf, rows))
+
+    def decode_data(self, shards, want=None):
+        """XOR-only counterpart of ErasureCode.decode_data()."""
+        for i in shards:
+            if not 0 <= i < self.n:
+                msg = 'Invalid shard index {}, must be in [0, {}).'
+                raise ValueError(msg.format(i, self.n))
+
+        if len(shards) < self.k:
+            msg = (
+                'Not enough shards to reconstruct original data. '
+                'Only {} shards received, but requires at least {} shards.'
+                    .format(len(shards), self.k)
+            )
+            raise ValueError(msg)
+
+        length = self.ec.check_buffers(shards.values())
+        self.check_length(length)
+
+        if want is None:
+            want = [i for i in xrange(self.n) if i not in shards]
+        else:
+            want = [i for i in want if i not in shards]
+        if not want:
+            return {}
+
+        survivors = tuple(sorted(shards)[:self.k])
+        schedule = self.schedule_cache.get((survivors, tuple(want)),
+                                           self.decode_schedule)
+        outs = self.run_schedule(schedule, [shards[i] for i in survivors],
+                                 length)
+        return dict(zip(want, outs))
@@ -0,0 +1,213 @@
+"""
+Precomputed decode matrices for every erasure pattern of a code.
+
+A bundle file holds the decode matrix of every set of k survivors of an
+ErasureCode(k, p), so a new process can decode any pattern without
+inverting a matrix or building translate tables first.  The file is memory
+mapped and the matrix for a survivor set is found by its rank among all
+k-subsets of the n shards in colex order:
+
+    header | encoding matrix | translate tables | flags | decode matrices
+
+The encoding matrix (n * k bytes) lets readers check that the bundle was
+built for the same code.  The translate tables are those of gf_vect for
+every coefficient, 256 bytes each.  There is one flag byte per survivor set,
+0 when its matrix is singular, followed by a k * k decode matrix per
+survivor set.
+
+Write a bundle with
+
+    python decode_bundle.py -k 10 -p 4 code-10-4.bundle
+
+and use it with ErasureCode.load_bundle().
+"""
+import mmap
+import os
+import struct
+
+from gf_base2 import gf2
+from gf_matrix import GFMatrix
+import gf_vect
+from mds import binomial, colex_unrank
+
+BUNDLE_MAGIC = 'ECDECBDL'
+BUNDLE_VERSION = 1
+
+# magic, version, k, p, field size m, g(x), matrix type, number of survivor
+# sets
+HEADER_FORMAT = '<8sHHHHH16sI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+TABLES_SIZE = 256 * 256
+
+# Most survivor sets a bundle is written for.  Each one is a matrix
+# inversion and k * k bytes of file, and C(n, k) grows quickly with p:
+# (10, 4) has 1001 sets but (32, 8) has over 76 million.
+MAX_SURVIVOR_SETS = 1 << 20
+
+
+def survivors_rank(survivors):
+    """Returns the colex rank of a sorted set of survivors."""
+    return sum(binomial(s, j + 1) for j, s in enumerate(survivors))
+
+
+def bundle_tables(gf):
+    """Returns the 256 translate tables of the field, 256 bytes each."""
+    tables = []
+    for c in xrange(256):
+        tbl = gf_vect.gf_vect_tbl(gf, c)
+        if tbl is None:
+            tbl = '\0' * 256
+        elif not tbl:
+            tbl = ''.join(map(chr, xrange(256)))
+        tables.append(tbl)
+    return ''.join(tables)
+
+
+def write_bundle(path, ec):
+    """Computes the decode matrix of every survivor set of ec into path.
+
+    The matrices are written out as they are computed, so memory use does
+    not grow with the number of survivor sets.  Raises ValueError if there
+    are more than MAX_SURVIVOR_SETS of them.
+
+    returns: number of survivor sets whose matrix is singular
+    """
+    count = binomial(ec.n, ec.k)
+    if count > MAX_SURVIVOR_SETS:
+        msg = (
+            'Too many survivor sets for a bundle of k = {}, p = {}: {}, but '
+            'at most {} are supported.'
+                .format(ec.k, ec.p, count, MAX_SURVIVOR_SETS)
+        )
+        raise ValueError(msg)
+
+    header = struct.pack(HEADER_FORMAT, BUNDLE_MAGIC, BUNDLE_VERSION, ec.k,
+                         ec.p, ec.gf.m, ec.gf.g, ec.matrix, count)
+    encoding = GFMatrix.from_rows(ec.encoding_matrix, ec.gf).data
+
+    flags = bytearray(count)
+    singular = '\0' * (ec.k * ec.k)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(encoding)
+        f.write(bundle_tables(ec.gf))
+
+        # The flags are only known once every matrix has been inverted
+        flags_offset = f.tell()
+        f.write(flags)
+
+        for idx in xrange(count):
+            survivors = colex_unrank(idx, ec.k)
+            mat = GFMatrix.from_rows(
+                [ec.encoding_matrix[i] for i in survivors], ec.gf)
+            try:
+                mat.invert()
+            except ValueError:
+                f.write(singular)
+                continue
+            flags[idx] = 1
+            f.write(mat.data)
+
+        f.seek(flags_offset)
+        f.write(flags)
+    os.rename(tmp_path, path)
+
+    return count - sum(flags)
+
+
+class DecodeBundle:
+    def __init__(self, path):
+        """Memory maps a bundle file written by write_bundle().
+
+        Raises ValueError if the file is not a valid bundle.
+        """
+        self.map = None
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise ValueError('{} is not a decode bundle'.format(path))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fields = struct.unpack(HEADER_FORMAT, self.map[:HEADER_SIZE])
+        magic, version, k, p, m, g, matrix, count = fields
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            self.close()
+            raise ValueError('{} is not a decode bundle'.format(path))
+
+        self.k = k
+        self.p = p
+        self.n = k + p
+        self.gf = gf2(m, g)
+        self.matrix = matrix.rstrip('\0')
+        self.count = count
+
+        self.encoding_offset = HEADER_SIZE
+        self.tables_offset = self.encoding_offset + self.n * k
+        self.flags_offset = self.tables_offset + TABLES_SIZE
+        self.matrices_offset = self.flags_offset + count
+
+        if count != binomial(self.n, k) or size != (self.matrices_offset +
+                                                    count * k * k):
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def matches(self, ec):
+        """Returns True if the bundle was built for the code of ec."""
+        if (ec.k, ec.p, ec.gf.m, ec.gf.g) != (self.k, self.p, self.gf.m,
+                                                self.gf.g):
+            return False
+        encoding = self.map[self.encoding_offset:self.tables_offset]
+        return encoding == str(GFMatrix.from_rows(ec.encoding_matrix,
+                                                  ec.gf).data)
+
+    def load_tables(self):
+        """Fills the gf_vect translate table cache from the bundle."""
+        gf_vect.gf_vect_load_tbls(
+            self.gf, self.map[self.tables_offset:self.flags_offset])
+
+    def decode_matrix(self, survivors):
+        """Returns the decode matrix of a set of k survivors as rows.
+
+        Raises ValueError if it is singular.
+        """
+        idx = survivors_rank(sorted(survivors))
+        if not ord(self.map[self.flags_offset + idx]):
+            raise ValueError('Matrix is singular')
+
+        k = self.k
+        offset = self.matrices_offset + idx * k * k
+        data = bytearray(self.map[offset:offset + k * k])
+        return GFMatrix(k, k, self.gf, data).to_rows()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from erasure_code import ErasureCode
+
+    parser = argparse.ArgumentParser(
+        description='Precompute the decode matrices of every erasure pattern.')
+    parser.add_argument('path', help='bundle file to write')
+    parser.add_argument('-k', type=int, required=True,
+                        help='number of data shards')
+    parser.add_argument('-p', type=int, required=True,
+                        help='number of parity shards')
+    parser.add_argument('--matrix', default='cauchy',
+                        choices=sorted(ErasureCode.matrix_gens))
+    args = parser.parse_args()
+
+    start = time.time()
+    ec = ErasureCode(args.k, args.p, matrix=args.matrix)
+    singular = write_bundle(args.path, ec)
+    print 'Wrote {} survivor sets ({} singular) to {}, {} bytes in {:.2f}s'\
+        .format(binomial(ec.n, ec.k), singular, args.path,
+                os.path.getsize(args.path), time.time() - start)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+
+
+class DecodeMatrixCache:
+    def __init__(self, maxsize=64):
+        """Bounded, thread-safe LRU cache of decode matrices.
+
+        Matrices are keyed on the tuple of survivor shard indices used to
+        build them, so every stripe with the same erasure pattern shares one
+        inversion.
+
+        maxsize: maximum number of matrices to keep.  0 disables caching.
+        """
+        if maxsize < 0:
+            raise ValueError('maxsize must not be negative, got {}'
+                             .format(maxsize))
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Returns the matrix for key, calling compute(key) on a miss.
+
+        The returned matrix is shared between callers and must not be
+        modified.
+        """
+        with self._lock:
+            try:
+                val = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                # Re-insert to mark as most recently used
+                self._entries[key] = val
+                self.hits += 1
+                return val
+
+        # Compute outside of the lock so other patterns are not blocked on a
+        # slow inversion.  Two threads missing on the same key at once both
+        # compute it, which is harmless.
+        val = compute(key)
+
+        with self._lock:
+            if self.maxsize and key not in self._entries:
+                self._entries[key] = val
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        return val
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns a dict of the hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
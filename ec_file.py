@@ -0,0 +1,650 @@
+"""
+Erasure coding of files.
+
+A file is split into stripes of k * block_size bytes.  Block i of each stripe
+is appended to shard file i, and the p parity blocks computed for the stripe
+are appended to shard files k..n-1.  The last stripe is zero padded.  The
+original size and coding parameters are kept in a small JSON manifest next to
+the shard files:
+
+    <prefix>.meta, <prefix>.0, <prefix>.1, ... <prefix>.<n-1>
+
+Each shard file starts with a HEADER_SIZE byte header describing the code
+(k, p, matrix type, block size, shard index and number of stripes), followed
+by its blocks and then a table with a checksum of every block:
+
+    header | block 0 | block 1 | ... | crc 0 | crc 1 | ...
+
+Keeping the checksums at the end leaves the blocks aligned.  Readers check
+the checksum of every block they use and treat blocks that fail as lost.
+
+Byte ranges of the original file can be read without restoring all of it
+with RangeReader.  Parity shards can be added or removed later with
+resize_parity(), which leaves the blocks of the existing shard files as
+they are.
+"""
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from erasure_code import ErasureCode
+
+# Default number of bytes each shard contributes to a stripe
+BLOCK_SIZE = 1 << 20
+
+# Block sizes must be a multiple of this so reads and writes stay aligned
+ALIGNMENT = 4096
+
+MANIFEST_VERSION = 2
+
+SHARD_MAGIC = 'ECSHARD\0'
+SHARD_VERSION = 1
+
+# The header takes a whole aligned block so the data blocks stay aligned
+HEADER_SIZE = ALIGNMENT
+
+# magic, version, k, p, shard index, matrix type, checksum type, block size,
+# stripes, original file size
+HEADER_FORMAT = '<8sHHHHBBIQQ'
+
+MATRIX_TYPES = ['cauchy', 'rs', 'vandermonde']
+
+# Block checksum algorithms.  CRC32C is not available in the standard
+# library, so blocks are checked with zlib's CRC32.
+CHECKSUM_CRC32 = 1
+
+CRC_FORMAT = '<I'
+CRC_SIZE = struct.calcsize(CRC_FORMAT)
+
+
+def shard_path(prefix, idx):
+    return '{}.{}'.format(prefix, idx)
+
+
+def manifest_path(prefix):
+    return prefix + '.meta'
+
+
+def read_manifest(prefix):
+    with open(manifest_path(prefix), 'rb') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        msg = 'Unsupported manifest version {} in {}.'
+        raise ValueError(msg.format(manifest.get('version'),
+                                    manifest_path(prefix)))
+    return manifest
+
+
+def write_manifest(prefix, manifest):
+    with open(manifest_path(prefix), 'wb') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def readinto_full(f, buf):
+    """Fills buf from f, returning fewer bytes than len(buf) only at EOF."""
+    total = 0
+    while total < len(buf):
+        nread = f.readinto(buf[total:])
+        if not nread:
+            break
+        total += nread
+    return total
+
+
+def crc(buf):
+    # zlib only takes read-only buffers, which a bytearray can be wrapped in
+    # without copying
+    if isinstance(buf, memoryview):
+        buf = buf.tobytes()
+    return zlib.crc32(buffer(buf)) & 0xffffffff
+
+
+def shard_file_size(manifest):
+    return (HEADER_SIZE +
+            manifest['stripes'] * (manifest['block_size'] + CRC_SIZE))
+
+
+def pack_header(manifest, idx):
+    header = struct.pack(
+        HEADER_FORMAT, SHARD_MAGIC, SHARD_VERSION, manifest['k'],
+        manifest['p'], idx, MATRIX_TYPES.index(manifest['matrix']),
+        CHECKSUM_CRC32, manifest['block_size'], manifest['stripes'],
+        manifest['size'])
+    return header + '\0' * (HEADER_SIZE - len(header))
+
+
+def unpack_header(buf):
+    """Returns the header fields as a dict, or None if buf is not a header."""
+    size = struct.calcsize(HEADER_FORMAT)
+    if len(buf) < size:
+        return None
+
+    fields = struct.unpack(HEADER_FORMAT, buf[:size])
+    (magic, version, k, p, idx, matrix, checksum, block_size, stripes,
+     file_size) = fields
+    if (magic != SHARD_MAGIC or version != SHARD_VERSION or
+            matrix >= len(MATRIX_TYPES) or checksum != CHECKSUM_CRC32):
+        return None
+
+    return {
+        'k': k,
+        'p': p,
+        'index': idx,
+        'matrix': MATRIX_TYPES[matrix],
+        'block_size': block_size,
+        'stripes': stripes,
+        'size': file_size,
+    }
+
+
+class ShardWriter:
+    def __init__(self, path, manifest, idx):
+        """Writes a shard file block by block.
+
+        The header is written again on close() with the final number of
+        stripes and file size taken from manifest.
+        """
+        self.manifest = manifest
+        self.idx = idx
+        self.crcs = []
+        self.f = open(path, 'wb')
+        self.f.write('\0' * HEADER_SIZE)
+
+    def write(self, block):
+        self.crcs.append(crc(block))
+        self.f.write(block)
+
+    def close(self):
+        if self.f.closed:
+            return
+        try:
+            self.f.write(''.join(struct.pack(CRC_FORMAT, c)
+                                 for c in self.crcs))
+            self.f.seek(0)
+            self.f.write(pack_header(self.manifest, self.idx))
+        finally:
+            self.f.close()
+
+
+class ShardFile:
+    def __init__(self, path, manifest, idx):
+        """Memory maps a shard file for reading.
+
+        Raises ValueError if the file does not match the manifest.
+        """
+        self.idx = idx
+        self.block_size = manifest['block_size']
+        self.stripes = manifest['stripes']
+        self.map = None
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size != shard_file_size(manifest):
+                raise ValueError('{} is truncated'.format(path))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = unpack_header(self.map[:HEADER_SIZE])
+        expected = dict((key, manifest[key]) for key in
+                        ['k', 'p', 'matrix', 'block_size', 'stripes', 'size'])
+        expected['index'] = idx
+        if header != expected:
+            self.close()
+            raise ValueError('{} has a bad header'.format(path))
+
+        crc_offset = HEADER_SIZE + self.stripes * self.block_size
+        self.crcs = struct.unpack('<{}I'.format(self.stripes),
+                                  self.map[crc_offset:])
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def block(self, stripe, start=0, end=None):
+        """Returns bytes [start, end) of the shard's block in stripe."""
+        if end is None:
+            end = self.block_size
+        offset = HEADER_SIZE + stripe * self.block_size
+        return self.map[offset + start:offset + end]
+
+    def block_ok(self, stripe, block):
+        return crc(block) == self.crcs[stripe]
+
+
+def encode_file(src_path, prefix, k, p, block_size=BLOCK_SIZE,
+                matrix='cauchy'):
+    """Erasure code a file into k data and p parity shard files.
+
+    Memory use is one stripe (k * block_size bytes) plus its parity,
+    regardless of the size of the file.
+
+    src_path:   file to encode
+    prefix:     path prefix of the manifest and shard files to write
+    k:          number of data shards
+    p:          number of parity shards
+    block_size: bytes per shard per stripe, a multiple of ALIGNMENT
+    matrix:     type of encoding matrix, one of MATRIX_TYPES
+
+    returns: the manifest dict that was written
+    """
+    if block_size <= 0 or block_size % ALIGNMENT:
+        msg = 'block_size must be a positive multiple of {}, got {}.'
+        raise ValueError(msg.format(ALIGNMENT, block_size))
+
+    ec = ErasureCode(k, p, matrix=matrix)
+
+    stripe = bytearray(k * block_size)
+    view = memoryview(stripe)
+    data = [view[i * block_size:(i + 1) * block_size] for i in xrange(k)]
+    parity = [bytearray(block_size) for _ in xrange(p)]
+
+    # Filled in as the file is read, the shard headers are written on close
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'k': k,
+        'p': p,
+        'matrix': matrix,
+        'block_size': block_size,
+        'size': 0,
+        'stripes': 0,
+    }
+
+    outs = []
+    try:
+        for i in xrange(ec.n):
+            outs.append(ShardWriter(shard_path(prefix, i), manifest, i))
+
+        with open(src_path, 'rb') as src:
+            while True:
+                nread = readinto_full(src, view)
+                if not nread:
+                    break
+
+                if nread < len(stripe):
+                    view[nread:] = '\0' * (len(stripe) - nread)
+
+                ec.encode_data(data, parity)
+                for out, block in zip(outs, data + parity):
+                    out.write(block)
+
+                manifest['size'] += nread
+                manifest['stripes'] += 1
+    finally:
+        for out in outs:
+            out.close()
+
+    write_manifest(prefix, manifest)
+
+    return manifest
+
+
+def open_shards(prefix, manifest):
+    """Memory maps the shard files that are present and valid.
+
+    returns: dict mapping shard index to its ShardFile
+    """
+    n = manifest['k'] + manifest['p']
+
+    shards = {}
+    for i in xrange(n):
+        try:
+            shards[i] = ShardFile(shard_path(prefix, i), manifest, i)
+        except (IOError, OSError, ValueError):
+            continue
+
+    return shards
+
+
+def close_shards(shards):
+    for shard in shards.values():
+        shard.close()
+
+
+def read_stripe(shard_files, stripe, k):
+    """Reads k blocks of a stripe whose checksums match.
+
+    Blocks are taken from the lowest shard indices first.  Blocks that fail
+    their checksum are treated as lost and the next shard is used instead.
+
+    returns: dict mapping shard index to block
+    """
+    blocks = {}
+    for i in sorted(shard_files):
+        block = shard_files[i].block(stripe)
+        if shard_files[i].block_ok(stripe, block):
+            blocks[i] = block
+            if len(blocks) == k:
+                return blocks
+
+    msg = (
+        'Not enough valid blocks in stripe {}. Only {} found, but requires '
+        'at least {}.'.format(stripe, len(blocks), k)
+    )
+    raise ValueError(msg)
+
+
+def restore_file(prefix, dst_path, regenerate=False):
+    """Restore a file from any k or more of its shard files.
+
+    Missing, truncated or otherwise invalid shard files are treated as lost,
+    and so are blocks failing their checksum.  The decode matrix for each
+    erasure pattern is computed once and reused for every stripe with that
+    pattern.
+
+    prefix:     path prefix of the manifest and shard files
+    dst_path:   file to write the original contents to
+    regenerate: if True, also rewrite the lost shard files
+
+    returns: list of regenerated shard indices
+    """
+    manifest = read_manifest(prefix)
+    k = manifest['k']
+    bs = manifest['block_size']
+    ec = ErasureCode(k, manifest['p'], matrix=manifest['matrix'])
+
+    shard_files = open_shards(prefix, manifest)
+    outs = {}
+    try:
+        if len(shard_files) < k:
+            msg = (
+                'Not enough shard files to restore {}. Only {} found, but '
+                'requires at least {}.'.format(prefix, len(shard_files), k)
+            )
+            raise ValueError(msg)
+
+        regen = [i for i in xrange(ec.n) if i not in shard_files]
+        if not regenerate:
+            regen = []
+        for i in regen:
+            outs[i] = ShardWriter(shard_path(prefix, i) + '.tmp', manifest, i)
+
+        remaining = manifest['size']
+        with open(dst_path, 'wb') as dst:
+            for stripe in xrange(manifest['stripes']):
+                blocks = read_stripe(shard_files, stripe, k)
+                want = [i for i in xrange(k) if i not in blocks] + regen
+                rebuilt = ec.decode_data(blocks, want)
+
+                for i in regen:
+                    outs[i].write(blocks[i] if i in blocks else rebuilt[i])
+
+                for i in xrange(k):
+                    block = blocks[i] if i in blocks else rebuilt[i]
+                    if remaining < bs:
+                        block = block[:remaining]
+                    dst.write(block)
+                    remaining -= len(block)
+
+        for i in regen:
+            outs[i].close()
+            os.rename(shard_path(prefix, i) + '.tmp', shard_path(prefix, i))
+
+    finally:
+        for out in outs.values():
+            out.close()
+        close_shards(shard_files)
+
+    return regen
+
+
+def scrub_file(prefix):
+    """Check every stripe of an encoded file for corruption.
+
+    Stripes are read one at a time from the memory mapped shard files, so
+    memory use stays bounded for any file size.  Blocks failing their
+    checksum are reported as corrupt.  Stripes whose checksums all match are
+    also checked for parity mismatches.
+
+    prefix: path prefix of the manifest and shard files
+
+    returns: list of (stripe, start, end, shard) tuples, where [start, end)
+             is the byte range within the blocks of the stripe that is
+             corrupt, from 0 to block_size, and shard is the shard found to
+             be corrupt there, or None.
+    """
+    manifest = read_manifest(prefix)
+    bs = manifest['block_size']
+    ec = ErasureCode(manifest['k'], manifest['p'], matrix=manifest['matrix'])
+
+    shard_files = open_shards(prefix, manifest)
+    try:
+        if len(shard_files) < ec.n:
+            missing = [i for i in xrange(ec.n) if i not in shard_files]
+            msg = 'Cannot scrub {}, shards {} are missing or invalid.'
+            raise ValueError(msg.format(prefix, missing))
+
+        res = []
+        for stripe in xrange(manifest['stripes']):
+            blocks = [shard_files[i].block(stripe) for i in xrange(ec.n)]
+
+            bad = [i for i, block in enumerate(blocks)
+                   if not shard_files[i].block_ok(stripe, block)]
+            if bad:
+                for i in bad:
+                    res.append((stripe, 0, bs, i))
+                continue
+
+            for start, end, shard in ec.verify(blocks):
+                res.append((stripe, start, end, shard))
+
+    finally:
+        close_shards(shard_files)
+
+    return res
+
+
+def resize_parity(prefix, p):
+    """Change the number of parity shards of an encoded file.
+
+    The existing shard files are kept as they are, only their headers are
+    rewritten for the new p.  Adding parity shards computes just the new ones
+    from the data in one pass over the stripes, decoding data blocks that are
+    lost or corrupt.  Removing parity shards deletes the last shard files.
+    This requires a matrix type whose parity rows do not depend on p, see
+    ErasureCode.compatible_parity().
+
+    The shard headers and the manifest are not updated atomically, so the
+    file may be left unreadable if this is interrupted.
+
+    prefix: path prefix of the manifest and shard files
+    p:      new number of parity shards
+
+    returns: the manifest dict that was written
+    """
+    manifest = read_manifest(prefix)
+    k = manifest['k']
+    old = ErasureCode(k, manifest['p'], matrix=manifest['matrix'])
+    ec = ErasureCode(k, p, matrix=manifest['matrix'])
+    if not ec.compatible_parity(old):
+        msg = (
+            'Cannot change p of {} from {} to {}, the {} encoding matrices '
+            'do not share their parity rows.'
+                .format(prefix, old.p, p, ec.matrix)
+        )
+        raise ValueError(msg)
+
+    new_manifest = dict(manifest, p=p)
+    added = range(old.n, ec.n)
+
+    shard_files = open_shards(prefix, manifest)
+    outs = {}
+    try:
+        kept = [i for i in sorted(shard_files) if i < ec.n]
+        if len(kept) < k:
+            msg = (
+                'Not enough shard files in {} to change p. Only {} would be '
+                'left, but requires at least {}.'.format(prefix, len(kept), k)
+            )
+            raise ValueError(msg)
+
+        for i in added:
+            outs[i] = ShardWriter(shard_path(prefix, i) + '.tmp',
+                                  new_manifest, i)
+
+        parity = [bytearray(manifest['block_size']) for _ in added]
+        for stripe in xrange(manifest['stripes'] if added else 0):
+            blocks = read_stripe(shard_files, stripe, k)
+            missing = [i for i in xrange(k) if i not in blocks]
+            rebuilt = old.decode_data(blocks, missing)
+
+            data = [blocks[i] if i in blocks else rebuilt[i]
+                    for i in xrange(k)]
+            ec.encode_parity(data, added, parity)
+            for i, block in zip(added, parity):
+                outs[i].write(block)
+
+        for i in added:
+            outs[i].close()
+
+    finally:
+        for out in outs.values():
+            out.close()
+        close_shards(shard_files)
+
+    for i in kept:
+        with open(shard_path(prefix, i), 'r+b') as f:
+            f.write(pack_header(new_manifest, i))
+
+    for i in added:
+        os.rename(shard_path(prefix, i) + '.tmp', shard_path(prefix, i))
+
+    write_manifest(prefix, new_manifest)
+
+    for i in xrange(ec.n, old.n):
+        try:
+            os.remove(shard_path(prefix, i))
+        except OSError:
+            pass
+
+    return new_manifest
+
+
+class RangeReader:
+    def __init__(self, prefix, verify=True):
+        """Random access reads of byte ranges of an encoded file.
+
+        Only the blocks overlapping a range are read.  Data blocks that are
+        lost are rebuilt from the same columns of k surviving blocks, so a
+        small read costs a small decode whatever the block size.
+
+        prefix: path prefix of the manifest and shard files
+        verify: if True, check the checksum of every block used and treat
+                blocks that fail as lost.  Each block is checked once.
+        """
+        self.manifest = read_manifest(prefix)
+        self.k = self.manifest['k']
+        self.block_size = self.manifest['block_size']
+        self.size = self.manifest['size']
+        self.verify = verify
+        self.ec = ErasureCode(self.k, self.manifest['p'],
+                              matrix=self.manifest['matrix'])
+
+        self.shard_files = open_shards(prefix, self.manifest)
+        if len(self.shard_files) < self.k:
+            close_shards(self.shard_files)
+            msg = (
+                'Not enough shard files to read {}. Only {} found, but '
+                'requires at least {}.'
+                    .format(prefix, len(self.shard_files), self.k)
+            )
+            raise ValueError(msg)
+
+        # (shard, stripe) -> whether the block passed its checksum
+        self.checked = {}
+
+    def close(self):
+        close_shards(self.shard_files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block_ok(self, idx, stripe):
+        if idx not in self.shard_files:
+            return False
+        if not self.verify:
+            return True
+
+        key = (idx, stripe)
+        if key not in self.checked:
+            shard = self.shard_files[idx]
+            self.checked[key] = shard.block_ok(stripe, shard.block(stripe))
+        return self.checked[key]
+
+    def read_blocks(self, stripe, ranges):
+        """Reads parts of the data blocks of a stripe.
+
+        ranges: dict mapping data block index to the (start, end) byte range
+                wanted from it
+
+        returns: dict mapping data block index to the bytes read
+        """
+        res = {}
+        missing = []
+        for i, (start, end) in ranges.iteritems():
+            if self.block_ok(i, stripe):
+                res[i] = self.shard_files[i].block(stripe, start, end)
+            else:
+                missing.append(i)
+
+        if not missing:
+            return res
+
+        # Decode the columns covering every missing range in one go
+        start = min(ranges[i][0] for i in missing)
+        end = max(ranges[i][1] for i in missing)
+
+        survivors = []
+        for i in sorted(self.shard_files):
+            if self.block_ok(i, stripe):
+                survivors.append(i)
+                if len(survivors) == self.k:
+                    break
+        else:
+            msg = (
+                'Not enough valid blocks in stripe {}. Only {} found, but '
+                'requires at least {}.'.format(stripe, len(survivors), self.k)
+            )
+            raise ValueError(msg)
+
+        shards = dict((i, self.shard_files[i].block(stripe, start, end))
+                      for i in survivors)
+        rebuilt = self.ec.decode_data(shards, missing)
+        for i in missing:
+            res[i] = str(rebuilt[i][ranges[i][0] - start:ranges[i][1] - start])
+
+        return res
+
+    def read(self, offset, length):
+        """Returns up to length bytes of the file starting at offset.
+
+        Fewer bytes are returned if the range extends past the end of the
+        file.
+        """
+        if offset < 0 or length < 0:
+            msg = 'Invalid range, offset {} and length {} must be >= 0.'
+            raise ValueError(msg.format(offset, length))
+
+        bs = self.block_size
+        end = min(offset + length, self.size)
+
+        parts = []
+        pos = offset
+        while pos < end:
+            stripe, stripe_pos = divmod(pos, self.k * bs)
+            stripe_end = min(end - pos + stripe_pos, self.k * bs)
+
+            ranges = {}
+            for i in xrange(stripe_pos // bs, (stripe_end - 1) // bs + 1):
+                ranges[i] = (max(stripe_pos - i * bs, 0),
+                             min(stripe_end - i * bs, bs))
+
+            blocks = self.read_blocks(stripe, ranges)
+            parts.extend(blocks[i] for i in sorted(blocks))
+            pos += stripe_end - stripe_pos
+
+        return ''.join(parts)
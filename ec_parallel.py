@@ -0,0 +1,224 @@
+"""
+Multi-process encoding and decoding of large shards.
+
+Shards are split into column ranges that are encoded or decoded independently
+by a pool of worker processes.  Shard data is exchanged through a temporary
+file that the parent and the workers all memory map (in /dev/shm when
+available), so only the file name and the column range are pickled for each
+task.  Every worker builds its own ErasureCode once, so its GF tables and
+decode matrix cache are reused for every task it runs.
+"""
+import mmap
+import multiprocessing
+import os
+import tempfile
+
+from erasure_code import ErasureCode
+import gf_vect
+
+# Column ranges handed to workers are a multiple of this many bytes
+ALIGNMENT = 4096
+
+# ErasureCode object of a worker process, set up by init_worker()
+_worker_ec = None
+
+
+def init_worker(k, p):
+    global _worker_ec
+    _worker_ec = ErasureCode(k, p)
+
+
+def map_region(path):
+    with open(path, 'r+b') as f:
+        return mmap.mmap(f.fileno(), 0)
+
+
+def encode_range(args):
+    """Encodes bytes [start, end) of the data shards in the shared region.
+
+    The region holds the k data shards followed by the p parity shards, each
+    length bytes long.
+    """
+    path, length, start, end = args
+    ec = _worker_ec
+
+    region = map_region(path)
+    try:
+        data = [region[i * length + start:i * length + end]
+                for i in xrange(ec.k)]
+        for i, parity in enumerate(ec.encode_data(data)):
+            offset = (ec.k + i) * length
+            region[offset + start:offset + end] = str(parity)
+    finally:
+        region.close()
+
+
+def decode_range(args):
+    """Decodes bytes [start, end) of the wanted shards in the shared region.
+
+    The region holds the survivor shards in the order given, followed by the
+    wanted shards, each length bytes long.
+    """
+    path, length, survivors, want, start, end = args
+    ec = _worker_ec
+
+    region = map_region(path)
+    try:
+        shards = dict(
+            (idx, region[i * length + start:i * length + end])
+            for i, idx in enumerate(survivors)
+        )
+        rebuilt = ec.decode_data(shards, want)
+        for i, idx in enumerate(want):
+            offset = (len(survivors) + i) * length
+            region[offset + start:offset + end] = str(rebuilt[idx])
+    finally:
+        region.close()
+
+
+class ParallelErasureCode:
+    def __init__(self, k, p, workers=None):
+        """Sets up a pool of worker processes for encoding and decoding.
+
+        k:       number of data shards
+        p:       number of parity shards
+        workers: number of worker processes, defaults to the number of CPUs
+        """
+        self.ec = ErasureCode(k, p)
+        self.k = k
+        self.p = p
+        self.n = k + p
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers, init_worker, (k, p))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column_ranges(self, length):
+        """Splits [0, length) into one aligned range per worker."""
+        chunk = -(-length // self.workers)
+        chunk = max(ALIGNMENT, -(-chunk // ALIGNMENT) * ALIGNMENT)
+        return [(start, min(start + chunk, length))
+                for start in xrange(0, length, chunk)]
+
+    @staticmethod
+    def create_region(bufs, size):
+        """Creates the shared region file holding bufs, padded to size.
+
+        returns: (path, mmap of the file)
+        """
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, path = tempfile.mkstemp(prefix='ec_parallel.', dir=shm_dir)
+        try:
+            os.ftruncate(fd, size)
+            region = mmap.mmap(fd, size)
+        except Exception:
+            os.unlink(path)
+            raise
+        finally:
+            os.close(fd)
+
+        # mmap slice assignment only takes str
+        offset = 0
+        for buf in bufs:
+            region[offset:offset + len(buf)] = str(gf_vect.as_bytes(buf))
+            offset += len(buf)
+
+        return path, region
+
+    def encode_data(self, data):
+        """Parallel version of ErasureCode.encode_data()."""
+        if len(data) != self.k:
+            msg = (
+                'Expected {} data shards but {} were given.'
+                    .format(self.k, len(data))
+            )
+            raise ValueError(msg)
+
+        length = self.ec.check_buffers(data)
+        if not length:
+            return [bytearray() for _ in xrange(self.p)]
+
+        path, region = self.create_region(data, self.n * length)
+        try:
+            tasks = [(path, length, start, end)
+                     for start, end in self.column_ranges(length)]
+            self.pool.map(encode_range, tasks)
+
+            return [bytearray(region[i * length:(i + 1) * length])
+                    for i in xrange(self.k, self.n)]
+        finally:
+            region.close()
+            os.unlink(path)
+
+    def decode_data(self, shards, want=None):
+        """Parallel version of ErasureCode.decode_data()."""
+        if len(shards) < self.k:
+            msg = (
+                'Not enough shards to reconstruct original data. '
+                'Only {} shards received, but requires at least {} shards.'
+                    .format(len(shards), self.k)
+            )
+            raise ValueError(msg)
+
+        length = self.ec.check_buffers(shards.values())
+        if want is None:
+            want = [i for i in xrange(self.n) if i not in shards]
+        else:
+            want = [i for i in want if i not in shards]
+        if not want or not length:
+            return dict((i, bytearray()) for i in want)
+
+        survivors = sorted(shards)[:self.k]
+        size = (len(survivors) + len(want)) * length
+        path, region = self.create_region([shards[i] for i in survivors],
+                                          size)
+        try:
+            tasks = [(path, length, survivors, want, start, end)
+                     for start, end in self.column_ranges(length)]
+            self.pool.map(decode_range, tasks)
+
+            res = {}
+            for i, idx in enumerate(want):
+                offset = (len(survivors) + i) * length
+                res[idx] = bytearray(region[offset:offset + length])
+            return res
+        finally:
+            region.close()
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description='Measure encode throughput for different worker counts.')
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('-p', type=int, default=4)
+    parser.add_argument('--shard-size', type=int, default=16 << 20,
+                        help='bytes per shard')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    data = [os.urandom(args.shard_size) for _ in xrange(args.k)]
+    total_mb = args.k * args.shard_size / float(1 << 20)
+
+    base = None
+    for workers in args.workers:
+        with ParallelErasureCode(args.k, args.p, workers) as pec:
+            start = time.time()
+            pec.encode_data(data)
+            elapsed = time.time() - start
+
+        base = base or elapsed
+        print '{:3} workers: {:8.1f} MB/s, speedup {:.2f}x'.format(
+            workers, total_mb / elapsed, base / elapsed)
@@ -0,0 +1,196 @@
+"""
+Erasure coding of streams of data.
+
+encode_stream() cuts data arriving as chunks of any size, for example from
+a socket, into stripes and yields the n shard chunks of each stripe.
+decode_stream() turns such stripes, with None for lost shard chunks, back
+into the original data.
+
+Reading is pipelined with coding: a background thread pulls the input into
+a small pool of reusable stripe buffers while the caller's thread encodes
+and consumes the previous stripes.  The buffers are recycled, so the shard
+chunks yielded for a stripe are only valid until the next one is requested
+and must be copied to be kept.
+"""
+import Queue
+import sys
+import threading
+
+import gf_vect
+
+# Seconds between checks for the consumer having gone away
+POLL_INTERVAL = 0.1
+
+
+def prefetch(items, depth):
+    """Iterates over items in a background thread, up to depth ahead.
+
+    Exceptions raised by items are re-raised by the returned generator.
+    Closing the generator stops the thread once it next yields an item.
+    Raises ValueError if depth is less than 1, as the read ahead would not
+    be bounded.
+    """
+    if depth < 1:
+        raise ValueError('depth must be at least 1, got {}.'.format(depth))
+
+    queue = Queue.Queue(depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception:
+            put((None, sys.exc_info()))
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            # Queue.get() without a timeout cannot be interrupted
+            item, exc_info = queue.get(timeout=1 << 30)
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def split_stripes(chunks, stripe_size, free):
+    """Copies chunks into stripe buffers taken from the free queue.
+
+    Yields (stripe_index, buffer, size) for each stripe, where size is the
+    number of bytes of input in the buffer.  The last stripe is zero padded.
+    Stops when a None buffer is taken from free.
+    """
+    index = 0
+    buf = None
+    pos = 0
+    for chunk in chunks:
+        chunk = memoryview(chunk)
+        offset = 0
+        while offset < len(chunk):
+            if buf is None:
+                buf = free.get()
+                if buf is None:
+                    return
+                pos = 0
+
+            count = min(stripe_size - pos, len(chunk) - offset)
+            buf[pos:pos + count] = chunk[offset:offset + count]
+            pos += count
+            offset += count
+
+            if pos == stripe_size:
+                yield index, buf, pos
+                index += 1
+                buf = None
+
+    if buf is not None and pos:
+        buf[pos:] = '\0' * (stripe_size - pos)
+        yield index, buf, pos
+
+
+def copy_stripes(stripes):
+    """Copies the shard chunks of each stripe as it is taken from stripes.
+
+    Sources such as encode_stream() reuse their buffers once the next
+    stripe is requested, so stripes read ahead must be copied first.
+    """
+    for index, shards, size in stripes:
+        yield index, [None if s is None else str(gf_vect.as_bytes(s))
+                      for s in shards], size
+
+
+def encode_stream(ec, chunks, stripe_size, depth=2):
+    """Erasure code a stream of data.
+
+    ec:          ErasureCode to encode with
+    chunks:      iterable of data chunks (str, bytearray or memoryview) of
+                 any size
+    stripe_size: bytes of data per stripe, a multiple of k.  Each shard
+                 chunk is stripe_size / k bytes.
+    depth:       number of stripes read ahead of encoding, at least 1
+
+    yields: (stripe_index, shards, size) for each stripe, where shards is
+            the list of n shard chunks and size the number of bytes of input
+            in the stripe, less than stripe_size only for the last stripe.
+            The chunks are reused for later stripes.
+    """
+    if stripe_size <= 0 or stripe_size % ec.k:
+        msg = 'stripe_size must be a positive multiple of {}, got {}.'
+        raise ValueError(msg.format(ec.k, stripe_size))
+
+    block_size = stripe_size // ec.k
+    parity = [bytearray(block_size) for _ in xrange(ec.p)]
+
+    # One buffer for the stripe being encoded, one being read and depth
+    # waiting in between
+    free = Queue.Queue()
+    for _ in xrange(depth + 2):
+        free.put(bytearray(stripe_size))
+
+    stripes = prefetch(split_stripes(chunks, stripe_size, free), depth)
+    try:
+        for index, buf, size in stripes:
+            view = memoryview(buf)
+            data = [view[i * block_size:(i + 1) * block_size]
+                    for i in xrange(ec.k)]
+            ec.encode_data(data, parity)
+
+            yield index, data + parity, size
+            free.put(buf)
+    finally:
+        # Wakes up the reader if it is waiting for a buffer
+        free.put(None)
+        stripes.close()
+
+
+def decode_stream(ec, stripes, depth=2):
+    """Restore a stream of data from stripes of shard chunks.
+
+    ec:      ErasureCode the stripes were encoded with
+    stripes: iterable of (stripe_index, shards, size) as yielded by
+             encode_stream(), with None in place of lost shard chunks.  The
+             shard chunks are copied as they are read, so they may be reused
+             by the source once the next stripe is requested.
+    depth:   number of stripes read ahead of decoding, at least 1
+
+    yields: (stripe_index, data) for each stripe, where data is a str of
+            size bytes
+    """
+    out = {}
+    for index, shards, size in prefetch(copy_stripes(stripes), depth):
+        if len(shards) != ec.n:
+            msg = 'Expected {} shard chunks in stripe {} but {} were given.'
+            raise ValueError(msg.format(ec.n, index, len(shards)))
+
+        present = dict((i, s) for i, s in enumerate(shards) if s is not None)
+        length = ec.check_buffers(present.values())
+
+        missing = [i for i in xrange(ec.k) if i not in present]
+        for i in missing:
+            if len(out.get(i, '')) != length:
+                out[i] = bytearray(length)
+
+        rebuilt = ec.decode_data(present, missing, out)
+        data = ''.join(
+            str(gf_vect.as_bytes(present[i] if i in present else rebuilt[i]))
+            for i in xrange(ec.k))
+        yield index, data[:size]
@@ -1,24 +1,74 @@
+from decode_cache import DecodeMatrixCache
 from gf_base2 import gf2
+from gf_matrix import GFMatrix
+import gf_vect
+import re
+import threading
 
 class ErasureCode:
-    def __init__(self, k, p):
+    # Encoding matrix types, mapped to the method generating them
+    matrix_gens = {
+        'cauchy': 'cauchy_matrix_gen',
+        'rs': 'rs_matrix_gen',
+        'vandermonde': 'vandermonde_matrix_gen',
+    }
+
+    def __init__(self, k, p, cache_size=64, matrix='cauchy'):
         """Sets up an object to compute the parity symbols for erasure codes.
 
         The total number of bytes after the EC process is n = k + m, where
 
         k: number of source bytes
         m: number of parity bytes to generate
+        cache_size: number of decode matrices (one per erasure pattern) to
+                    keep cached
+        matrix: type of encoding matrix, one of matrix_gens
         """
+        if matrix not in self.matrix_gens:
+            msg = 'Unknown matrix type {}, must be one of {}.'
+            raise ValueError(msg.format(matrix, sorted(self.matrix_gens)))
+
         self.k = k
         self.p = p
         self.n = k + p
+        self.matrix = matrix
 
         # Using GF(2^8) with 0x11b as g(x)
         self.gf = gf2(8, 283)
 
-        # self.encoding_matrix = self.rs_matrix_gen()
-        self.encoding_matrix = self.cauchy_matrix_gen()
-        # self.encoding_matrix = self.vandermonde_matrix_gen()
+        self.encoding_matrix = getattr(self, self.matrix_gens[matrix])()
+
+        # Translate tables for the parity rows of the encoding matrix, used
+        # for every stripe.  They come from the process-wide cache of
+        # gf_vect_tbl(), so constructing a codec stays cheap.
+        self.encode_tbls = [[self.vect_tbl(c) for c in row]
+                            for row in self.encoding_matrix[self.k:]]
+        self._g_tbls = None
+
+        self.decode_cache = DecodeMatrixCache(cache_size)
+
+        # Precomputed decode matrices, see load_bundle()
+        self.bundle = None
+
+        # Bytes of all-zero blocks left out of encode_data() and
+        # decode_data(), see gf_vect.gf_vect_dot_prod().  Each call counts
+        # into its own dict, which is added in under the lock so concurrent
+        # calls do not lose counts.
+        self.zero_stats = {'zero_bytes_skipped': 0, 'zero_bytes_out': 0}
+        self._zero_stats_lock = threading.Lock()
+
+    @property
+    def g_tbls(self):
+        """Split nibble tables for the parity rows of the encoding matrix.
+
+        Same layout as ec_init_tables() in ec_base.c, 32 bytes per
+        coefficient.  encode_tbls are the same tables expanded to 256 bytes.
+        Built on first use.
+        """
+        if self._g_tbls is None:
+            self._g_tbls = gf_vect.ec_init_tables(
+                self.gf, self.k, self.p, self.encoding_matrix[self.k:])
+        return self._g_tbls
 
     @staticmethod
     def identity_matrix_gen(n):
@@ -70,31 +120,29 @@ class ErasureCode:
         return mat
 
     def vandermonde_matrix_gen(self):
-        mat = []
-
         # Create Vandermonde matrix
-        for r in xrange(self.n):
-            row = [self.gf.pow(r, c) for c in xrange(self.k)]
-            mat.append(row)
+        mat = GFMatrix.from_rows(
+            [[self.gf.pow(r, c) for c in xrange(self.k)]
+             for r in xrange(self.n)],
+            self.gf)
 
         # Transform matrix to get identity matrix for the top k rows
         for i in xrange(self.k):
             # Find another row if pivot is 0
-            if mat[i][i] == 0:
+            if mat[i, i] == 0:
                 for j in xrange(i + 1, self.n):
-                    if mat[j][i] != 0:
-                        self.matrix_swap_rows(mat, i, j)
+                    if mat[j, i] != 0:
+                        mat.swap_rows(i, j)
                         break
 
             # If there are no rows with non-zero element in ith column
-            if mat[i][i] == 0:
+            if mat[i, i] == 0:
                 print 'Cannot generate Vandermonde matrix:'
-                self.matrix_print(mat)
+                self.matrix_print(mat.to_rows())
                 raise ValueError
 
             # Scale row so pivot is 1
-            inv = self.gf.mult_inv(mat[i][i])
-            mat[i] = [self.gf.mult(c, inv) for c in mat[i]]
+            mat.scale_row(i, self.gf.mult_inv(mat[i, i]))
 
             # Zero out the ith column in other rows up to k-1 row
             for j in xrange(self.k):
@@ -102,11 +150,9 @@ class ErasureCode:
                 if j == i:
                     continue
 
-                scale = mat[j][i]
-                mat[j] = [self.gf.add(self.gf.mult(scale, e_i), e_j) for e_i, e_j
-                           in zip(mat[i], mat[j])]
+                mat.add_scaled_row(j, i, mat[j, i])
 
-        return mat
+        return mat.to_rows()
 
     @staticmethod
     def matrix_print(mat):
@@ -143,29 +189,9 @@ class ErasureCode:
         return res
 
     def matrix_mult(self, a, b):
-        a_rows = len(a)
-        a_cols = len(a[0])
-        b_rows = len(b)
-        b_cols = len(b[0])
-
-        try:
-            res = []
-
-            for r in xrange(a_rows):
-                row = []
-                for c in xrange(b_cols):
-                    row.append(self.dot_prod(a, b, r, c))
-                res.append(row)
-
-            return res
-
-        except IndexError:
-            msg = (
-                'Invaid matrix multiplication. Cannot multiply ({} x {}) '
-                'matrix by ({} x {}) matrix.'
-                    .format(a_rows, a_cols, b_rows, b_cols)
-            )
-            raise ValueError(msg)
+        a_mat = GFMatrix.from_rows(a, self.gf)
+        b_mat = GFMatrix.from_rows(b, self.gf)
+        return a_mat.mult(b_mat).to_rows()
 
     @staticmethod
     def matrix_transpose(a):
@@ -190,17 +216,168 @@ class ErasureCode:
 
         returns: a list of p parity bytes, set during object initialization.
         """
-        # Take the bottom portion of encoding matrix to generate the parity
-        # bytes
-        partial_mat = self.encoding_matrix[self.k:]
+        if len(src) != self.k:
+            msg = (
+                'Expected {} source bytes but {} were given.'
+                    .format(self.k, len(src))
+            )
+            raise ValueError(msg)
 
-        # Make src into a matrix (list of lists)
-        src_trans = self.matrix_transpose([src])
+        # Look up each product in the precomputed tables for the bottom
+        # portion of the encoding matrix instead of calling gf.mult()
+        parity = []
+        for tbls in self.encode_tbls:
+            res = 0
+            for tbl, x in zip(tbls, src):
+                if tbl:
+                    res ^= ord(tbl[x])
+                elif tbl is not None:
+                    res ^= x
+            parity.append(res)
+
+        return parity
+
+    def vect_tbl(self, c):
+        """Returns the table to pass to gf_vect_dot_prod for coefficient c."""
+        return gf_vect.gf_vect_tbl(self.gf, c)
+
+    def check_buffers(self, bufs):
+        """Returns the common length of bufs, raising ValueError otherwise."""
+        lengths = set(len(b) for b in bufs)
+        if len(lengths) > 1:
+            msg = (
+                'All shard buffers must have the same length, got lengths {}.'
+                    .format(sorted(lengths))
+            )
+            raise ValueError(msg)
 
-        parity = self.matrix_mult(partial_mat, src_trans)
-        parity_trans = self.matrix_transpose(parity)
+        return lengths.pop() if lengths else 0
 
-        return parity_trans[0]
+    @staticmethod
+    def check_out_buffers(out, length):
+        """Raises ValueError unless out buffers are writable, length bytes."""
+        for buf in out:
+            if isinstance(buf, str) or getattr(buf, 'readonly', False):
+                raise ValueError('Output buffers must be writable.')
+            if len(buf) != length:
+                msg = 'Output buffers must be {} bytes long, got {}.'
+                raise ValueError(msg.format(length, len(buf)))
+
+    def encode_data(self, data, out=None):
+        """Generate parity shards for Erasure Code
+
+        Buffer level version of encode(), see ec_encode_data_base() in
+        ec_base.c.  Byte i of each parity shard is the parity for byte i of
+        the data shards.
+
+        data: a list of k data shards (str, bytearray or memoryview), all of
+              the same length.
+        out:  optional list of p writable buffers (bytearray or memoryview)
+              of the same length as the data shards to write the parity
+              shards into.
+
+        returns: a list of p parity shards, each a bytearray of the same length
+                 as the data shards, or out if given.
+        """
+        return self.encode_parity(data, range(self.k, self.n), out)
+
+    def encode_parity(self, data, rows, out=None):
+        """Generate only some of the parity shards.
+
+        data: a list of k data shards, as for encode_data().
+        rows: list of the shard indices of the parity shards to generate,
+              each in [k, n).
+        out:  optional list of writable buffers, one per row, of the same
+              length as the data shards to write the parity shards into.
+
+        returns: a list of parity shards in the order of rows, each a
+                 bytearray of the same length as the data shards, or out if
+                 given.
+        """
+        if len(data) != self.k:
+            msg = (
+                'Expected {} data shards but {} were given.'
+                    .format(self.k, len(data))
+            )
+            raise ValueError(msg)
+
+        for row in rows:
+            if not self.k <= row < self.n:
+                msg = 'Invalid parity shard index {}, must be in [{}, {}).'
+                raise ValueError(msg.format(row, self.k, self.n))
+
+        length = self.check_buffers(data)
+
+        if out is None:
+            out = [bytearray(length) for _ in rows]
+        elif len(out) != len(rows):
+            msg = (
+                'Expected {} parity output buffers but {} were given.'
+                    .format(len(rows), len(out))
+            )
+            raise ValueError(msg)
+        else:
+            self.check_out_buffers(out, length)
+
+        stats = dict.fromkeys(self.zero_stats, 0)
+        for row, buf in zip(rows, out):
+            gf_vect.gf_vect_dot_prod(self.encode_tbls[row - self.k], data,
+                                     length, buf, stats)
+        self._add_zero_stats(stats)
+
+        return out
+
+    def _add_zero_stats(self, stats):
+        with self._zero_stats_lock:
+            for key, count in stats.iteritems():
+                self.zero_stats[key] += count
+
+    def compatible_parity(self, other):
+        """Returns True if the parity shards of other are shards of self.
+
+        That is the case when both codes have the same k and the encoding
+        matrix of the code with fewer parity shards is the top of the other
+        one.  Then p can be changed by only adding or dropping parity shards,
+        see encode_parity().  The parity rows of every type of matrix in
+        matrix_gens are computed from their row index alone, not from p.
+        """
+        if self.k != other.k or self.gf.g != other.gf.g:
+            return False
+        n = min(self.n, other.n)
+        return self.encoding_matrix[:n] == other.encoding_matrix[:n]
+
+    def update_parity(self, shard_index, old_data, new_data, parity_buffers):
+        """Update parity shards in place after one data shard changed.
+
+        Folds the difference between the old and new contents of the data
+        shard into each parity shard, see ec_encode_data_update_base() in
+        ec_base.c.  Only the changed shard has to be read instead of all k.
+
+        shard_index:    index of the changed data shard, 0..k-1
+        old_data:       previous contents of the data shard
+        new_data:       new contents of the data shard
+        parity_buffers: list of p writable parity shards (bytearray or
+                        writable memoryview), updated in place.
+        """
+        if not 0 <= shard_index < self.k:
+            msg = 'Invalid data shard index {}, must be in [0, {}).'
+            raise ValueError(msg.format(shard_index, self.k))
+
+        if len(parity_buffers) != self.p:
+            msg = (
+                'Expected {} parity shards but {} were given.'
+                    .format(self.p, len(parity_buffers))
+            )
+            raise ValueError(msg)
+
+        length = self.check_buffers([old_data, new_data] + list(parity_buffers))
+
+        # Adding in GF(2^8) is XOR, so the delta is the sum of old and new
+        delta = gf_vect.gf_vect_dot_prod(['', ''], [old_data, new_data], length)
+
+        for row_tbls, parity in zip(self.encode_tbls, parity_buffers):
+            tbls = [row_tbls[shard_index], '']
+            parity[:] = gf_vect.gf_vect_dot_prod(tbls, [delta, parity], length)
 
     @staticmethod
     def matrix_swap_rows(a, row1, row2):
@@ -209,42 +386,17 @@ class ErasureCode:
         a[row2] = temp
 
     def matrix_inv(self, a):
-        # Make a copy of the matrix so it is not modified
-        orig = [row[:] for row in a]
-        dimension = len(orig)
-        res = self.identity_matrix_gen(dimension)
-
-        for i in xrange(dimension):
-            # if the pivot is zero, try to find another row to swap
-            if orig[i][i] == 0:
-                for j in xrange(i + 1, dimension):
-                    if orig[j][i] != 0:
-                        self.matrix_swap_rows(orig, i, j)
-                        self.matrix_swap_rows(res, i, j)
-                        break
-
-            # If there are no rows with non-zero element in ith column
-            if orig[i][i] == 0:
-                print 'Cannot find inverse for the following matrix:'
-                self.matrix_print(a)
-                raise ValueError
+        # from_rows() copies the matrix so it is not modified
+        mat = GFMatrix.from_rows(a, self.gf)
 
-            # Scale row so pivot is 1
-            inv = self.gf.mult_inv(orig[i][i])
-            orig[i] = [self.gf.mult(c, inv) for c in orig[i]]
-            res[i] = [self.gf.mult(c, inv) for c in res[i]]
-
-            # Zero out the ith column in other rows
-            for j in xrange(dimension):
-                # Skip the current row
-                if j == i:
-                    continue
-
-                scale = orig[j][i]
-                orig[j] = [self.gf.add(self.gf.mult(scale, e_i), e_j) for e_i, e_j in zip(orig[i], orig[j])]
-                res[j] = [self.gf.add(self.gf.mult(scale, e_i), e_j) for e_i, e_j in zip(res[i], res[j])]
+        try:
+            mat.invert()
+        except ValueError:
+            print 'Cannot find inverse for the following matrix:'
+            self.matrix_print(a)
+            raise
 
-        return res
+        return mat.to_rows()
 
     def decode(self, data):
         """Calculate the original src data.
@@ -256,13 +408,13 @@ class ErasureCode:
         """
         # Create the submatrix to be inversed and the data matrix at the same
         # time.
-        mat = []
+        survivors = []
         ec_data = []
         num_bytes = 0
         for i in xrange(self.n):
             if data[i] is not None:
-                # Add the corresponding row from the encoding matrix
-                mat.append(self.encoding_matrix[i])
+                # Record the corresponding row from the encoding matrix
+                survivors.append(i)
                 # construct the n x 1 matrix to multiply
                 ec_data.append([data[i]])
                 num_bytes += 1
@@ -283,8 +435,8 @@ class ErasureCode:
             )
             raise ValueError(msg)
 
-        # Inverse matrix
-        mat_inv = self.matrix_inv(mat)
+        # Inverse matrix, shared by all calls with the same erasure pattern
+        mat_inv = self.decode_matrix(survivors)
 
         # Multiply matrix
         orig = self.matrix_mult(mat_inv, ec_data)
@@ -292,14 +444,328 @@ class ErasureCode:
 
         return orig_trans[0]
 
+    def decode_matrix(self, survivors):
+        """Returns the k x k matrix to recover the data from the survivors.
 
-if __name__ == '__main__':
+        survivors: list of k shard indices, row i of the result applied to the
+                   shards at these indices gives data shard i.
+
+        Results are cached per survivor set and must not be modified.
+        """
+        return self.decode_cache.get(tuple(survivors), self._decode_matrix)
+
+    def _decode_matrix(self, survivors):
+        # Bundles hold the matrices for survivors in increasing order only
+        if self.bundle is not None and list(survivors) == sorted(survivors):
+            return self.bundle.decode_matrix(survivors)
+
+        mat = [self.encoding_matrix[i] for i in survivors]
+        return self.matrix_inv(mat)
+
+    def load_bundle(self, path):
+        """Use the precomputed decode matrices of a bundle file.
+
+        The file is memory mapped, so decoding needs no matrix inversion
+        even for erasure patterns not seen before.  See decode_bundle.py.
+
+        Raises ValueError if the bundle was built for a different code.
+        """
+        import decode_bundle
+
+        bundle = decode_bundle.DecodeBundle(path)
+        if not bundle.matches(self):
+            bundle.close()
+            msg = '{} was not built for this {} matrix with k = {}, p = {}.'
+            raise ValueError(msg.format(path, self.matrix, self.k, self.p))
+
+        bundle.load_tables()
+        self.bundle = bundle
+        self.decode_cache.clear()
+
+    def decode_data(self, shards, want=None, out=None):
+        """Rebuild the missing shards from the surviving ones.
+
+        shards: dict mapping shard index (0..n-1) to its buffer (str,
+                bytearray or memoryview), all of the same length.  Indices
+                0..k-1 are data shards and k..n-1 are parity shards.
+        want:   optional list of missing shard indices to rebuild, defaults
+                to all missing shards.
+        out:    optional dict mapping each shard index to rebuild to a
+                writable buffer of the same length as the shards to write
+                it into.
+        returns: dict mapping each rebuilt shard index to a bytearray, or to
+                 its buffer from out.  Surviving shards are not copied or
+                 returned.
+        """
+        for i in list(shards) + list(want or []):
+            if not 0 <= i < self.n:
+                msg = 'Invalid shard index {}, must be in [0, {}).'
+                raise ValueError(msg.format(i, self.n))
+
+        if len(shards) < self.k:
+            msg = (
+                'Not enough shards to reconstruct original data. '
+                'Only {} shards received, but requires at least {} shards.'
+                    .format(len(shards), self.k)
+            )
+            raise ValueError(msg)
+
+        length = self.check_buffers(shards.values())
+        if want is None:
+            missing = [i for i in xrange(self.n) if i not in shards]
+        else:
+            missing = [i for i in want if i not in shards]
+        if not missing:
+            return {}
+
+        if out is None:
+            out = dict((i, bytearray(length)) for i in missing)
+        else:
+            absent = [i for i in missing if i not in out]
+            if absent:
+                msg = 'No output buffers given for shards {}.'
+                raise ValueError(msg.format(absent))
+            self.check_out_buffers([out[i] for i in missing], length)
+
+        # Use the first k shards, which are the data shards when none of them
+        # are lost.
+        survivors = sorted(shards)[:self.k]
+        srcs = [shards[i] for i in survivors]
+
+        if survivors[-1] == self.k - 1:
+            # Only parity is lost, so just encode the missing rows.
+            decode_rows = [self.encoding_matrix[i] for i in missing]
+        else:
+            mat_inv = self.decode_matrix(survivors)
+            decode_rows = []
+            for i in missing:
+                if i < self.k:
+                    decode_rows.append(mat_inv[i])
+                else:
+                    row = self.matrix_mult([self.encoding_matrix[i]], mat_inv)
+                    decode_rows.append(row[0])
+
+        res = {}
+        stats = dict.fromkeys(self.zero_stats, 0)
+        for i, row in zip(missing, decode_rows):
+            tbls = [self.vect_tbl(c) for c in row]
+            res[i] = gf_vect.gf_vect_dot_prod(tbls, srcs, length, out[i],
+                                              stats)
+        self._add_zero_stats(stats)
+
+        return res
+
+    def verify(self, shards):
+        """Check that the parity shards agree with the data shards.
+
+        Computes the syndrome of each parity shard (its stored contents plus
+        the parity recomputed from the data shards), which is zero wherever
+        the stripe is consistent.
 
-    k = 16
-    p = 4
-    ec = ErasureCode(k, p)
-    ec.matrix_print(ec.encoding_matrix)
-    #a = ec.encode([11, 22, 33, 44])
-    #print a
-    #b = ec.decode([111, None, 33, None, None, 151])
-    #print b
\ No newline at end of file
+        shards: list of n shards, all of the same length.
+        returns: list of (start, end, shard) tuples, one per byte range where
+                 some syndrome is not zero.  shard is the index of the shard
+                 whose corruption explains the syndromes in that range, or
+                 None if no single shard does (or p is 1, where any shard
+                 could be at fault).  An empty list means the stripe is
+                 consistent.
+        """
+        if len(shards) != self.n:
+            msg = 'Expected {} shards but {} were given.'
+            raise ValueError(msg.format(self.n, len(shards)))
+
+        length = self.check_buffers(shards)
+        data = shards[:self.k]
+
+        syndromes = []
+        for tbls, parity in zip(self.encode_tbls, shards[self.k:]):
+            syndromes.append(gf_vect.gf_vect_dot_prod(
+                tbls + [''], data + [parity], length))
+
+        combined = 0
+        for syn in syndromes:
+            combined |= gf_vect.to_long(syn)
+        if not combined:
+            return []
+
+        res = []
+        combined = gf_vect.from_long(combined, length)
+        for match in re.finditer('[^\\x00]+', combined):
+            start, end = match.span()
+            res.append((start, end, self.locate_error(
+                [syn[start:end] for syn in syndromes])))
+
+        return res
+
+    def locate_error(self, syndromes):
+        """Returns the single shard that explains the syndromes, or None.
+
+        If data shard j has error E, syndrome l is coefficient (l, j) of the
+        encoding matrix times E.  If parity shard k + l has an error, only
+        syndrome l is not zero.
+        """
+        if self.p < 2:
+            return None
+
+        zero = '\0' * len(syndromes[0])
+        nonzero = [l for l, syn in enumerate(syndromes) if syn != zero]
+        if len(nonzero) == 1:
+            return self.k + nonzero[0]
+
+        suspects = []
+        for j in xrange(self.k):
+            coefs = [row[j] for row in self.encoding_matrix[self.k:]]
+            l0 = next((l for l, c in enumerate(coefs) if c), None)
+            if l0 is None:
+                continue
+
+            # Recover the error E from syndrome l0, then check every syndrome
+            err_tbl = self.vect_tbl(self.gf.mult_inv(coefs[l0]))
+            err = syndromes[l0].translate(err_tbl) if err_tbl else syndromes[l0]
+            for c, syn in zip(coefs, syndromes):
+                tbl = self.vect_tbl(c)
+                if tbl is None:
+                    expected = zero
+                else:
+                    expected = err.translate(tbl) if tbl else err
+                if syn != expected:
+                    break
+            else:
+                suspects.append(j)
+
+        return suspects[0] if len(suspects) == 1 else None
+
+    def decode_batch(self, stripes, want=None):
+        """Rebuild the missing shards of many stripes at once.
+
+        Stripes are grouped by the set of shards that survived.  The survivor
+        shards of each group are concatenated so the whole group is decoded
+        with one decode matrix and one decode_data() call.
+
+        stripes: list of dicts mapping shard index to buffer, as for
+                 decode_data().  Stripes may have different shard lengths.
+        want:    optional list of shard indices to rebuild in every stripe,
+                 defaults to all missing shards.
+        returns: list of dicts mapping each rebuilt shard index to a
+                 bytearray, in the same order as stripes.
+        """
+        groups = {}
+        for idx, shards in enumerate(stripes):
+            groups.setdefault(tuple(sorted(shards)), []).append(idx)
+
+        res = [None] * len(stripes)
+        for survivors, members in groups.iteritems():
+            lengths = [self.check_buffers(stripes[m].values()) for m in members]
+
+            joined = dict(
+                (i, ''.join(gf_vect.as_bytes(stripes[m][i]) for m in members))
+                for i in survivors
+            )
+            rebuilt = self.decode_data(joined, want)
+
+            offset = 0
+            for m, length in zip(members, lengths):
+                res[m] = dict((i, buf[offset:offset + length])
+                              for i, buf in rebuilt.iteritems())
+                offset += length
+
+        return res
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Erasure code tools.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    matrix_parser = subparsers.add_parser(
+        'matrix', help='print the encoding matrix')
+    matrix_parser.add_argument('-k', type=int, default=16,
+                               help='number of data shards')
+    matrix_parser.add_argument('-p', type=int, default=4,
+                               help='number of parity shards')
+
+    encode_parser = subparsers.add_parser(
+        'encode', help='encode a file into k + p shard files')
+    encode_parser.add_argument('src', help='file to encode')
+    encode_parser.add_argument('prefix',
+                               help='path prefix of the shard files')
+    encode_parser.add_argument('-k', type=int, required=True,
+                               help='number of data shards')
+    encode_parser.add_argument('-p', type=int, required=True,
+                               help='number of parity shards')
+    encode_parser.add_argument('--block-size', type=int, default=1 << 20,
+                               help='bytes per shard per stripe')
+    encode_parser.add_argument('--matrix', default='cauchy',
+                               choices=sorted(ErasureCode.matrix_gens),
+                               help='type of encoding matrix')
+
+    restore_parser = subparsers.add_parser(
+        'restore', help='restore a file from k or more of its shard files')
+    restore_parser.add_argument('prefix',
+                                help='path prefix of the shard files')
+    restore_parser.add_argument('dst', help='file to write')
+    restore_parser.add_argument('--regenerate', action='store_true',
+                                help='also rewrite missing shard files')
+
+    read_parser = subparsers.add_parser(
+        'read', help='write a byte range of an encoded file to stdout')
+    read_parser.add_argument('prefix',
+                             help='path prefix of the shard files')
+    read_parser.add_argument('offset', type=int)
+    read_parser.add_argument('length', type=int)
+
+    scrub_parser = subparsers.add_parser(
+        'scrub', help='check the parity of shard files for corruption')
+    scrub_parser.add_argument('prefix',
+                              help='path prefix of the shard files')
+
+    resize_parser = subparsers.add_parser(
+        'resize', help='add or remove parity shard files')
+    resize_parser.add_argument('prefix',
+                               help='path prefix of the shard files')
+    resize_parser.add_argument('-p', type=int, required=True,
+                               help='new number of parity shards')
+
+    args = parser.parse_args()
+
+    if args.command == 'matrix':
+        ec = ErasureCode(args.k, args.p)
+        ec.matrix_print(ec.encoding_matrix)
+
+    elif args.command == 'encode':
+        import ec_file
+        manifest = ec_file.encode_file(args.src, args.prefix, args.k, args.p,
+                                       args.block_size, args.matrix)
+        print 'Encoded {} bytes into {} stripes'.format(manifest['size'],
+                                                        manifest['stripes'])
+
+    elif args.command == 'restore':
+        import ec_file
+        rebuilt = ec_file.restore_file(args.prefix, args.dst,
+                                       args.regenerate)
+        if rebuilt:
+            print 'Regenerated shards {}'.format(rebuilt)
+
+    elif args.command == 'read':
+        import ec_file
+        import sys
+        with ec_file.RangeReader(args.prefix) as reader:
+            sys.stdout.write(reader.read(args.offset, args.length))
+
+    elif args.command == 'scrub':
+        import ec_file
+        errors = ec_file.scrub_file(args.prefix)
+        for stripe, start, end, shard in errors:
+            print ('stripe {}: bytes [{}, {}) of its blocks inconsistent, '
+                   'corrupt shard: {}'.format(
+                       stripe, start, end,
+                       'unknown' if shard is None else shard))
+        if errors:
+            parser.exit(1)
+
+    elif args.command == 'resize':
+        import ec_file
+        manifest = ec_file.resize_parity(args.prefix, args.p)
+        print 'Now {} data and {} parity shards'.format(manifest['k'],
+                                                        manifest['p'])
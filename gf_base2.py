@@ -1,3 +1,11 @@
+from array import array
+import coef
+
+# Log/exp tables are the same for every gf2 object with the same (m, g), so
+# they are built once per process and shared.
+_tables = {}
+
+
 class gf2:
     def __init__(self, m, g):
         """ Initialize object for GF(2^m) calculations.
@@ -19,19 +27,69 @@ class gf2:
         self.g = g
         self.order = 2 ** m
 
-        # Using log and exp tables for calculations is faster, but would require
-        # the knowledge of a generator for the particular m.  Here we just
-        # calculate the multiplication table manually.
-        self.mult_tbl = [
-            [self.long_mult(row, col) for col in xrange(self.order)]
-            for row in xrange(self.order)
-        ]
+        tables = _tables.get((m, g))
+        if tables is None:
+            tables = self.gen_tables()
+            _tables[(m, g)] = tables
+
+        # exp_tbl is twice as long as needed so the sum of two logs can be
+        # used as an index without reducing it mod (order - 1).
+        #
+        # Multiplicative inverses.  Inverse for 0 is undefined, it is stored
+        # as 0 here and mult_inv() returns 'None' for it.
+        self.exp_tbl, self.log_tbl, self.mult_inv_tbl = tables
+
+    def gen_tables(self):
+        """Returns the (exp, log, inverse) tables for this field.
+
+        ISA-L's tables from coef.py are used for GF(2^8) with
+        g(x) = 0x11d, otherwise a generator is searched for and its powers
+        computed with long_mult().
+        """
+        order = self.order
+        if self.m <= 8:
+            typecode = 'B'
+        elif self.m <= 16:
+            typecode = 'H'
+        else:
+            typecode = 'L'
+
+        if (self.m, self.g) == (8, 0x11d):
+            powers = coef.gff_base[:order - 1]
+        else:
+            powers = self.gen_powers()
+
+        exp_tbl = array(typecode, powers * 2)
+
+        log_tbl = array(typecode, [0]) * order
+        for i, x in enumerate(powers):
+            log_tbl[x] = i
+
+        mult_inv_tbl = array(typecode, [0]) * order
+        for x in xrange(1, order):
+            mult_inv_tbl[x] = exp_tbl[(order - 1 - log_tbl[x]) % (order - 1)]
+
+        return exp_tbl, log_tbl, mult_inv_tbl
+
+    def gen_powers(self):
+        """Returns the powers 0..order-2 of a generator of the field."""
+        for gen in xrange(2, self.order):
+            powers = [1]
+            x = gen
+            # x can reach 0 or cycle without reaching 1 when g(x) is not
+            # irreducible
+            while x != 1 and x and len(powers) < self.order:
+                powers.append(x)
+                x = self.long_mult(x, gen)
+
+            if x == 1 and len(powers) == self.order - 1:
+                return powers
+
+        if self.order == 2:
+            return [1]
 
-        # Multiplicative inverses.  Inverse for 0 is undefined but we record a
-        # 'None' here to make indexing more intuitive.
-        self.mult_inv_tbl = [ None ]
-        for row in xrange(1, self.order):
-            self.mult_inv_tbl.append(self.mult_tbl[row].index(1))
+        msg = 'No generator found, g(x) = {} is not irreducible.'
+        raise ValueError(msg.format(self.g))
 
     @staticmethod
     def add(x, y):
@@ -42,16 +100,21 @@ class gf2:
         return x
 
     def mult(self, x, y):
-        return self.mult_tbl[x][y]
+        if not x or not y:
+            return 0
+        return self.exp_tbl[self.log_tbl[x] + self.log_tbl[y]]
 
     def mult_inv(self, x):
+        if not x:
+            return None
         return self.mult_inv_tbl[x]
 
     def pow(self, x, y):
-        res = 1
-        for i in xrange(y):
-            res = self.mult(res, x)
-        return res
+        if not y:
+            return 1
+        if not x:
+            return 0
+        return self.exp_tbl[self.log_tbl[x] * y % (self.order - 1)]
 
     def long_mult(self, x, y):
         prod = 0
@@ -70,4 +133,4 @@ class gf2:
             if prod & g_msb << i:
                 prod ^= self.g << i
 
-        return prod
\ No newline at end of file
+        return prod
@@ -0,0 +1,201 @@
+"""
+Matrices over GF(2^8) stored as contiguous bytes.
+
+Rows are operated on as a whole with the buffer level functions in gf_vect,
+so a row operation costs a few C calls rather than one Python level gf.mult()
+per element.
+"""
+from gf_base2 import gf2
+import gf_vect
+
+
+class GFMatrix:
+    def __init__(self, rows, cols, gf=None, data=None):
+        """Creates a rows x cols matrix.
+
+        gf:   gf2 object for GF(2^8), defaults to g(x) = 0x11b
+        data: optional bytearray of rows * cols elements in row major order,
+              used without copying.  Defaults to the zero matrix.
+        """
+        if gf is None:
+            gf = gf2(8, 283)
+        if gf.m != 8:
+            raise ValueError('GFMatrix only supports GF(2^8), got m = {}'
+                             .format(gf.m))
+
+        if data is None:
+            data = bytearray(rows * cols)
+        elif len(data) != rows * cols:
+            msg = 'Expected {} elements for a ({} x {}) matrix, got {}.'
+            raise ValueError(msg.format(rows * cols, rows, cols, len(data)))
+
+        self.rows = rows
+        self.cols = cols
+        self.gf = gf
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows, gf=None):
+        """Creates a matrix from a list of rows."""
+        num_cols = len(rows[0]) if rows else 0
+        data = bytearray()
+        for row in rows:
+            if len(row) != num_cols:
+                raise ValueError('All rows must have {} elements'
+                                 .format(num_cols))
+            data.extend(row)
+        return cls(len(rows), num_cols, gf, data)
+
+    @classmethod
+    def identity(cls, n, gf=None):
+        mat = cls(n, n, gf)
+        for i in xrange(n):
+            mat.data[i * n + i] = 1
+        return mat
+
+    def to_rows(self):
+        """Returns the matrix as a list of rows of ints."""
+        return [list(self.data[r * self.cols:(r + 1) * self.cols])
+                for r in xrange(self.rows)]
+
+    def copy(self):
+        return GFMatrix(self.rows, self.cols, self.gf, bytearray(self.data))
+
+    def __eq__(self, other):
+        return (isinstance(other, GFMatrix) and self.rows == other.rows and
+                self.cols == other.cols and self.data == other.data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getitem__(self, idx):
+        r, c = idx
+        return self.data[r * self.cols + c]
+
+    def __setitem__(self, idx, val):
+        r, c = idx
+        self.data[r * self.cols + c] = val
+
+    def row(self, r):
+        """Returns a writable view of row r."""
+        return memoryview(self.data)[r * self.cols:(r + 1) * self.cols]
+
+    def submatrix(self, rows, cols=None):
+        """Returns a new matrix made of the given rows.
+
+        rows: list of row indices, in the order they should appear
+        cols: optional (start, end) column range, defaults to all columns
+        """
+        start, end = cols if cols is not None else (0, self.cols)
+        data = bytearray()
+        for r in rows:
+            offset = r * self.cols
+            data += self.data[offset + start:offset + end]
+        return GFMatrix(len(rows), end - start, self.gf, data)
+
+    def swap_rows(self, i, j):
+        if i == j:
+            return
+        a = self.row(i).tobytes()
+        self.row(i)[:] = self.row(j).tobytes()
+        self.row(j)[:] = a
+
+    def scale_row(self, r, c):
+        """Multiplies row r by c."""
+        tbl = gf_vect.gf_vect_tbl(self.gf, c)
+        if tbl is None:
+            self.row(r)[:] = '\0' * self.cols
+        elif tbl:
+            row = self.row(r)
+            row[:] = row.tobytes().translate(tbl)
+
+    def add_scaled_row(self, dst, src, c):
+        """Adds c times row src to row dst."""
+        tbls = ['', gf_vect.gf_vect_tbl(self.gf, c)]
+        row = self.row(dst)
+        row[:] = gf_vect.gf_vect_dot_prod(tbls, [row, self.row(src)],
+                                          self.cols)
+
+    def mult(self, other, out=None):
+        """Returns self x other.
+
+        out: optional matrix of the right size to write the product into
+        """
+        if self.cols != other.rows:
+            msg = (
+                'Invaid matrix multiplication. Cannot multiply ({} x {}) '
+                'matrix by ({} x {}) matrix.'
+                    .format(self.rows, self.cols, other.rows, other.cols)
+            )
+            raise ValueError(msg)
+
+        if out is None:
+            out = GFMatrix(self.rows, other.cols, self.gf)
+        elif (out.rows, out.cols) != (self.rows, other.cols):
+            msg = 'Output matrix must be ({} x {}), got ({} x {}).'
+            raise ValueError(msg.format(self.rows, other.cols,
+                                        out.rows, out.cols))
+
+        srcs = [other.row(i) for i in xrange(other.rows)]
+        for r in xrange(self.rows):
+            tbls = [gf_vect.gf_vect_tbl(self.gf, c)
+                    for c in self.data[r * self.cols:(r + 1) * self.cols]]
+            out.row(r)[:] = gf_vect.gf_vect_dot_prod(tbls, srcs, other.cols)
+
+        return out
+
+    def invert(self):
+        """Inverts the matrix in place, see gf_invert_matrix() in ec_base.c.
+
+        Raises ValueError if the matrix is singular, leaving it unchanged.
+        """
+        n = self.rows
+        if n != self.cols:
+            msg = 'Cannot invert a non-square ({} x {}) matrix.'
+            raise ValueError(msg.format(self.rows, self.cols))
+
+        width = 2 * n
+        ident = self.identity(n, self.gf).data
+
+        # Each row of the augmented matrix [self | I] is kept as one long, so
+        # eliminating a column costs one translate and one XOR per row.
+        aug = [gf_vect.to_long(self.data[r * n:(r + 1) * n] +
+                               ident[r * n:(r + 1) * n])
+               for r in xrange(n)]
+
+        for i in xrange(n):
+            shift = 8 * (width - 1 - i)
+
+            # if the pivot is zero, try to find another row to swap
+            for j in xrange(i, n):
+                if (aug[j] >> shift) & 0xff:
+                    break
+            else:
+                raise ValueError('Matrix is singular')
+            aug[i], aug[j] = aug[j], aug[i]
+
+            # Scale row so pivot is 1
+            pivot = gf_vect.from_long(aug[i], width)
+            inv = self.gf.mult_inv(ord(pivot[i]))
+            if inv != 1:
+                pivot = pivot.translate(gf_vect.gf_vect_tbl(self.gf, inv))
+                aug[i] = gf_vect.to_long(pivot)
+
+            # Zero out the ith column in other rows
+            for j in xrange(n):
+                scale = (aug[j] >> shift) & 0xff
+                if j == i or not scale:
+                    continue
+
+                tbl = gf_vect.gf_vect_tbl(self.gf, scale)
+                prod = pivot.translate(tbl) if tbl else pivot
+                aug[j] ^= gf_vect.to_long(prod)
+
+        mask = (1 << (8 * n)) - 1
+        self.data[:] = ''.join(gf_vect.from_long(row & mask, n)
+                               for row in aug)
+        return self
+
+    def inverse(self):
+        """Returns the inverse as a new matrix."""
+        return self.copy().invert()
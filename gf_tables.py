@@ -47,8 +47,12 @@ if __name__ == "__main__":
     print_tbl(order, order, add_tbl)
     print
 
+    mult_tbl = [
+        [gf.mult(row, col) for col in xrange(order)]
+        for row in xrange(order)
+    ]
     print "Multiplication table:"
-    print_tbl(order, order, gf.mult_tbl)
+    print_tbl(order, order, mult_tbl)
     print
 
     print "Multiplicative inverses:"
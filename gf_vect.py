@@ -0,0 +1,213 @@
+"""
+Buffer level GF(2^8) operations, modeled on the gf_vect_* functions in
+ec_base.c.
+
+Multiplying a whole buffer by a constant is done with str.translate() using a
+256 byte lookup table for that constant, and adding (XOR-ing) buffers is done
+on Python longs, so the per-byte work happens in C rather than in the
+interpreter.
+"""
+import binascii
+
+# Granularity at which all-zero regions of the sources are skipped
+ZERO_BLOCK_SIZE = 4096
+ZERO_BLOCK = '\0' * ZERO_BLOCK_SIZE
+
+
+def gf_vect_mul_init(gf, c):
+    """Returns the 32 byte split nibble table for multiplying by c.
+
+    Same layout as gf_vect_mul_init() in ec_base.c: c times 0x00..0x0f
+    followed by c times 0x00, 0x10, .. 0xf0, so that
+        c * x = tbl[x & 0xf] ^ tbl[16 + (x >> 4)]
+
+    gf: gf2 object for GF(2^8)
+    c:  constant to multiply by
+    """
+    lo = [gf.mult(c, x) for x in xrange(16)]
+    hi = [gf.mult(c, x << 4) for x in xrange(16)]
+    return ''.join(map(chr, lo + hi))
+
+
+def ec_init_tables(gf, k, rows, a):
+    """Returns the split nibble tables for every coefficient of a matrix.
+
+    Same layout as ec_init_tables() in ec_base.c, 32 bytes per coefficient,
+    row by row.
+
+    gf:   gf2 object for GF(2^8)
+    k:    number of columns
+    rows: number of rows
+    a:    the matrix, as a list of rows
+    """
+    return ''.join(gf_vect_mul_init(gf, a[r][c])
+                   for r in xrange(rows) for c in xrange(k))
+
+
+def gf_vect_expand_tbl(tbl):
+    """Expands a 32 byte split nibble table into a 256 byte translate table.
+
+    str.translate() does the whole table gather in C, so one full table
+    lookup per byte is faster than separate low and high nibble lookups.
+    """
+    lo = map(ord, tbl[:16])
+    hi = map(ord, tbl[16:32])
+    return ''.join(chr(lo[x & 0xf] ^ hi[x >> 4]) for x in xrange(256))
+
+
+# Expanded translate tables shared by all users of a field, keyed on
+# (m, g, c)
+_tbls = {}
+
+
+def gf_vect_tbl(gf, c):
+    """Returns the table to pass to gf_vect_dot_prod for coefficient c.
+
+    Tables are built on first use and shared process-wide.
+    """
+    if c == 0:
+        return None
+    if c == 1:
+        return ''
+
+    key = (gf.m, gf.g, c)
+    tbl = _tbls.get(key)
+    if tbl is None:
+        tbl = gf_vect_expand_tbl(gf_vect_mul_init(gf, c))
+        _tbls[key] = tbl
+    return tbl
+
+
+def gf_vect_load_tbls(gf, tbls):
+    """Fills the table cache from 256 precomputed tables.
+
+    tbls: str of 256 * 256 bytes, table c at offset 256 * c
+    """
+    for c in xrange(2, 256):
+        _tbls.setdefault((gf.m, gf.g, c), tbls[256 * c:256 * (c + 1)])
+
+
+def as_bytes(buf):
+    """Returns buf in a form accepted by translate() and hexlify().
+
+    str and bytearray are returned as is, memoryview is copied out.
+    """
+    if isinstance(buf, memoryview):
+        return buf.tobytes()
+    return buf
+
+
+def to_long(buf):
+    return long(binascii.hexlify(buf) or '0', 16)
+
+
+def from_long(val, length):
+    """Converts val back into a str of length bytes."""
+    if not length:
+        return ''
+    return binascii.unhexlify('%0*x' % (2 * length, val))
+
+
+def gf_vect_mul(tbl, src):
+    """Multiplies every byte in src by the constant tbl was built for."""
+    return as_bytes(src).translate(tbl)
+
+
+def zero_blocks(src, length):
+    """Returns a flag per ZERO_BLOCK_SIZE block of src, True if it is all 0.
+
+    The last block may be shorter.
+    """
+    flags = []
+    for offset in xrange(0, length, ZERO_BLOCK_SIZE):
+        size = min(ZERO_BLOCK_SIZE, length - offset)
+        zero = ZERO_BLOCK if size == ZERO_BLOCK_SIZE else '\0' * size
+        flags.append(src.startswith(zero, offset))
+    return flags
+
+
+def zero_runs(flags, length):
+    """Splits [0, length) into runs of blocks with the same non-zero sources.
+
+    flags: list with the zero_blocks() flags of each source, or None for
+           sources without any zero block
+
+    returns: list of (start, end, sources) tuples, where sources lists the
+             indices of the sources that are not zero in [start, end)
+    """
+    runs = []
+    for b, offset in enumerate(xrange(0, length, ZERO_BLOCK_SIZE)):
+        end = min(offset + ZERO_BLOCK_SIZE, length)
+        sources = [j for j, f in enumerate(flags) if f is None or not f[b]]
+        if runs and runs[-1][2] == sources:
+            runs[-1] = (runs[-1][0], end, sources)
+        else:
+            runs.append((offset, end, sources))
+    return runs
+
+
+def gf_vect_dot_prod(tbls, srcs, length, out=None, stats=None):
+    """Computes the dot product of a row of coefficients with the sources.
+
+    Sources of at least ZERO_BLOCK_SIZE bytes are checked for blocks that
+    are all zero, which are left out of the sum.  Where every source is
+    zero the result is known to be zero and nothing is computed.
+
+    tbls:   list of translate tables, one per source.  None means the
+            coefficient is 0 and the source is skipped.  '' means the
+            coefficient is 1 and the source is used as is.
+    srcs:   list of source buffers, each length bytes long
+    length: length of each source buffer
+    out:    optional writable buffer of length bytes to store the result in
+    stats:  optional dict whose 'zero_bytes_skipped' (source bytes left out)
+            and 'zero_bytes_out' (result bytes known to be zero) counts are
+            increased
+
+    returns: str of length bytes, or out if given
+    """
+    active = [(tbl, as_bytes(src)) for tbl, src in zip(tbls, srcs)
+              if tbl is not None]
+
+    # Finding a run of zeros is much cheaper than checking every block, so
+    # sources without one are not split up
+    flags = [None] * len(active)
+    if length >= ZERO_BLOCK_SIZE:
+        flags = [zero_blocks(src, length) if src.find(ZERO_BLOCK) >= 0
+                 else None for _, src in active]
+
+    if all(f is None for f in flags):
+        runs = [(0, length, range(len(active)))]
+    else:
+        runs = zero_runs(flags, length)
+
+    parts = []
+    skipped = 0
+    zero_out = 0
+    for start, end, sources in runs:
+        size = end - start
+        skipped += (len(active) - len(sources)) * size
+        if not sources:
+            parts.append('\0' * size)
+            zero_out += size
+            continue
+
+        acc = 0
+        for j in sources:
+            tbl, src = active[j]
+            if size != length:
+                src = src[start:end]
+            if tbl:
+                src = src.translate(tbl)
+            acc ^= to_long(src)
+        parts.append(from_long(acc, size))
+
+    if stats is not None:
+        stats['zero_bytes_skipped'] += skipped
+        stats['zero_bytes_out'] += zero_out
+
+    res = parts[0] if len(parts) == 1 else ''.join(parts)
+    if out is None:
+        return res
+
+    out[:] = res
+    return out
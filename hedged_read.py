@@ -0,0 +1,224 @@
+"""
+Hedged shard reads.
+
+Shards are usually read from many disks or nodes with uneven latency, and
+waiting for k particular shards makes every read as slow as the slowest of
+them.  HedgedReader issues reads to k + extra shards at once from a pool of
+threads, decodes as soon as any k have arrived and cancels the rest.  If k
+have not arrived after hedge_after seconds, the remaining shards are read
+too.  Failed reads are replaced by reads of shards not tried yet.
+
+Shard readers are plain callables, read_shard(idx, cancel), that return the
+contents of shard idx or raise an exception.  cancel is a threading.Event
+set once the read is no longer needed, which readers may poll to give up
+early.  FakeShardBackend is an in-process reader with configurable per-shard
+delays for testing and benchmarking without real nodes.
+"""
+from multiprocessing.pool import ThreadPool
+import Queue
+import threading
+import time
+
+
+class ShardReadCancelled(Exception):
+    pass
+
+
+class FakeShardBackend:
+    def __init__(self, shards, delays=None, failures=()):
+        """In-process shard reader that simulates per-shard latency.
+
+        shards:   list of shard contents
+        delays:   optional dict mapping shard index to its read delay in
+                  seconds, either a number or a callable returning one per
+                  read.  Missing shards have no delay.
+        failures: shard indices whose reads raise IOError
+        """
+        self.shards = shards
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.lock = threading.Lock()
+        self.started = []
+        self.cancelled = []
+
+    def delay(self, idx):
+        delay = self.delays.get(idx, 0)
+        return delay() if callable(delay) else delay
+
+    def __call__(self, idx, cancel):
+        with self.lock:
+            self.started.append(idx)
+
+        # Event.wait() returns early once the read is cancelled
+        cancel.wait(self.delay(idx))
+        if cancel.is_set():
+            with self.lock:
+                self.cancelled.append(idx)
+            raise ShardReadCancelled(idx)
+
+        if idx in self.failures:
+            raise IOError('Failed to read shard {}'.format(idx))
+        return self.shards[idx]
+
+
+class HedgedReader:
+    def __init__(self, ec, read_shard, extra=0, hedge_after=None,
+                 workers=None):
+        """Sets up hedged reads of the shards of a stripe.
+
+        ec:          code of the stripe, an ErasureCode or any object with
+                     k, n and decode_data()
+        read_shard:  callable read_shard(idx, cancel) returning shard idx
+        extra:       number of shards to read beyond k up front
+        hedge_after: seconds to wait for k shards before reading all the
+                     remaining ones, None to only replace failed reads
+        workers:     number of reader threads, defaults to n
+        """
+        self.ec = ec
+        self.read_shard = read_shard
+        self.extra = extra
+        self.hedge_after = hedge_after
+        self.pool = ThreadPool(workers or ec.n)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, idx, cancel, results):
+        if cancel.is_set():
+            return
+        try:
+            results.put((idx, self.read_shard(idx, cancel), None))
+        except Exception as e:
+            results.put((idx, None, e))
+
+    def read_shards(self):
+        """Reads shards until any k have arrived.
+
+        Data shards are read first, so no decoding is needed when they are
+        all fast.
+
+        returns: dict mapping shard index to contents, k entries
+        """
+        k = self.ec.k
+        results = Queue.Queue()
+        cancel = threading.Event()
+
+        order = range(self.ec.n)
+        issued = 0
+        pending = 0
+        errors = {}
+        shards = {}
+
+        def issue(count):
+            for idx in order[issued:issued + count]:
+                self.pool.apply_async(self.fetch, (idx, cancel, results))
+            return min(count, len(order) - issued)
+
+        count = issue(k + self.extra)
+        issued += count
+        pending += count
+
+        deadline = None
+        if self.hedge_after is not None:
+            deadline = time.time() + self.hedge_after
+
+        try:
+            while len(shards) < k:
+                if not pending:
+                    msg = (
+                        'Not enough shards to reconstruct original data. '
+                        'Only {} of {} shards could be read, but requires '
+                        'at least {} shards. Errors: {}'
+                            .format(len(shards), self.ec.n, k, errors)
+                    )
+                    raise ValueError(msg)
+
+                # Queue.get() without a timeout cannot be interrupted
+                timeout = 1 << 30
+                if deadline is not None and issued < len(order):
+                    timeout = max(deadline - time.time(), 0)
+
+                try:
+                    idx, shard, error = results.get(timeout=timeout)
+                except Queue.Empty:
+                    # Out of time, read every remaining shard
+                    count = issue(len(order))
+                    issued += count
+                    pending += count
+                    deadline = None
+                    continue
+
+                pending -= 1
+                if error is not None:
+                    errors[idx] = error
+                    count = issue(1)
+                    issued += count
+                    pending += count
+                else:
+                    shards[idx] = shard
+        finally:
+            cancel.set()
+
+        return shards
+
+    def read(self):
+        """Reads the data shards of the stripe, decoding any not read.
+
+        returns: list of the k data shards
+        """
+        shards = self.read_shards()
+        rebuilt = self.ec.decode_data(shards, range(self.ec.k))
+        return [shards[i] if i in shards else rebuilt[i]
+                for i in xrange(self.ec.k)]
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import random
+
+    from erasure_code import ErasureCode
+
+    parser = argparse.ArgumentParser(
+        description='Compare read latency with and without hedging against '
+                    'shards with heavy-tailed delays.')
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('-p', type=int, default=4)
+    parser.add_argument('--shard-size', type=int, default=4096)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.002,
+                        help='typical shard read delay in seconds')
+    parser.add_argument('--slow', type=float, default=0.05,
+                        help='probability of a read being 20x slower')
+    args = parser.parse_args()
+
+    def delay():
+        scale = 20 if random.random() < args.slow else 1
+        return random.expovariate(1 / args.delay) * scale
+
+    ec = ErasureCode(args.k, args.p)
+    data = [os.urandom(args.shard_size) for _ in xrange(args.k)]
+    shards = data + map(str, ec.encode_data(data))
+    backend = FakeShardBackend(shards,
+                               dict((i, delay) for i in xrange(ec.n)))
+
+    for extra, hedge_after in [(0, None), (0, 4 * args.delay),
+                               (1, None), (2, None), (2, 4 * args.delay)]:
+        with HedgedReader(ec, backend, extra, hedge_after) as reader:
+            times = []
+            for _ in xrange(args.reads):
+                start = time.time()
+                assert reader.read() == data
+                times.append(time.time() - start)
+
+        times.sort()
+        print 'extra {} hedge {:<6} p50 {:7.2f}ms  p99 {:7.2f}ms'.format(
+            extra, hedge_after, times[len(times) // 2] * 1e3,
+            times[int(0.99 * (len(times) - 1))] * 1e3)
@@ -0,0 +1,221 @@
+"""
+Local Reconstruction Codes.
+
+The k data shards are split into l local groups of consecutive shards.  Each
+group gets a local parity shard, the XOR of its data shards, and g global
+parity shards are computed over all data shards with the encoding matrix of
+ErasureCode.  Shards are numbered:
+
+    0..k-1          data shards
+    k..k+l-1        local parity of group 0..l-1
+    k+l..k+l+g-1    global parity shards
+
+A single lost shard of a group is rebuilt by XOR-ing the other k / l shards
+of the group instead of decoding from k shards, which divides the repair
+traffic by l.  Other erasure patterns fall back to decoding from k linearly
+independent surviving shards.  Any g lost shards can be rebuilt if the
+global matrix is MDS.  Beyond that, whether a pattern is recoverable depends
+on the global matrix, and decode_data() raises ValueError for patterns that
+are not.
+"""
+from decode_cache import DecodeMatrixCache
+from erasure_code import ErasureCode
+from gf_matrix import GFMatrix
+import gf_vect
+
+
+class LocalReconstructionCode:
+    def __init__(self, k, l, g, cache_size=64, matrix='cauchy'):
+        """Sets up an LRC with l local groups and g global parities.
+
+        k:          number of data shards
+        l:          number of local groups, and so of local parity shards
+        g:          number of global parity shards
+        cache_size: number of repair plans to keep cached
+        matrix:     type of encoding matrix for the global parities
+        """
+        if not 1 <= l <= k:
+            msg = 'Number of local groups must be in [1, {}], got {}.'
+            raise ValueError(msg.format(k, l))
+
+        self.ec = ErasureCode(k, g, cache_size, matrix)
+        self.gf = self.ec.gf
+        self.k = k
+        self.l = l
+        self.g = g
+        self.p = l + g
+        self.n = k + l + g
+
+        # Group sizes differ by at most one
+        self.groups = [range(j * k // l, (j + 1) * k // l) for j in xrange(l)]
+        self.data_group = [j for j, group in enumerate(self.groups)
+                           for _ in group]
+
+        self.plan_cache = DecodeMatrixCache(cache_size)
+
+    def group_of(self, i):
+        """Returns the local group of shard i, None for global parities."""
+        if i < self.k:
+            return self.data_group[i]
+        if i < self.k + self.l:
+            return i - self.k
+        return None
+
+    def group_members(self, j):
+        """Returns the shard indices of group j, its local parity last."""
+        return self.groups[j] + [self.k + j]
+
+    def generator_row(self, i):
+        """Returns the coefficients of shard i over the data shards."""
+        if i < self.k:
+            return [int(c == i) for c in xrange(self.k)]
+        if i < self.k + self.l:
+            group = self.groups[i - self.k]
+            return [int(c in group) for c in xrange(self.k)]
+        return list(self.ec.encoding_matrix[i - self.l])
+
+    def encode_data(self, data):
+        """Generate the local and global parity shards.
+
+        data: a list of k data shards (str, bytearray or memoryview), all of
+              the same length.
+
+        returns: a list of l + g parity shards, the l local parities followed
+                 by the g global parities, each a bytearray.
+        """
+        if len(data) != self.k:
+            msg = (
+                'Expected {} data shards but {} were given.'
+                    .format(self.k, len(data))
+            )
+            raise ValueError(msg)
+
+        length = self.ec.check_buffers(data)
+
+        parity = []
+        for group in self.groups:
+            srcs = [data[i] for i in group]
+            parity.append(bytearray(
+                gf_vect.gf_vect_dot_prod([''] * len(srcs), srcs, length)))
+
+        return parity + self.ec.encode_data(data)
+
+    def independent_survivors(self, survivors):
+        """Picks k survivors whose generator rows are linearly independent.
+
+        Survivors are considered in order, so data shards are preferred.
+
+        returns: list of k shard indices, or None if the survivors do not
+                 span the data
+        """
+        # Rows of the basis found so far, reduced so each has a leading 1
+        # in its pivot column and zeros in the pivot columns of the others
+        basis = []
+        picked = []
+        for i in survivors:
+            row = self.generator_row(i)
+            for pivot, brow in basis:
+                if row[pivot]:
+                    c = row[pivot]
+                    row = [a ^ self.gf.mult(c, b) for a, b in zip(row, brow)]
+
+            pivot = next((c for c, e in enumerate(row) if e), None)
+            if pivot is None:
+                continue
+
+            inv = self.gf.mult_inv(row[pivot])
+            row = [self.gf.mult(inv, e) for e in row]
+            for idx, (bpivot, brow) in enumerate(basis):
+                if brow[pivot]:
+                    c = brow[pivot]
+                    basis[idx] = (bpivot, [a ^ self.gf.mult(c, b)
+                                           for a, b in zip(brow, row)])
+            basis.append((pivot, row))
+            picked.append(i)
+
+            if len(picked) == self.k:
+                return picked
+
+        return None
+
+    def repair_plan(self, key):
+        """Plans how to rebuild shards want from survivors.
+
+        Shards whose group has every other member surviving are rebuilt from
+        the group alone.  All other shards are decoded from k independent
+        survivors.
+
+        returns: list of (shard, sources, coefficients) tuples
+        """
+        survivors, want = key
+        available = set(survivors)
+
+        plan = []
+        rest = []
+        for i in want:
+            j = self.group_of(i)
+            if j is not None:
+                sources = [m for m in self.group_members(j) if m != i]
+                if available.issuperset(sources):
+                    plan.append((i, sources, [1] * len(sources)))
+                    continue
+            rest.append(i)
+
+        if not rest:
+            return plan
+
+        sources = self.independent_survivors(survivors)
+        if sources is None:
+            msg = (
+                'Cannot rebuild shards {} from shards {}, the erasure pattern '
+                'is not recoverable.'.format(list(rest), list(survivors))
+            )
+            raise ValueError(msg)
+
+        mat_inv = GFMatrix.from_rows(
+            [self.generator_row(i) for i in sources], self.gf).inverse()
+        for i in rest:
+            row = GFMatrix.from_rows([self.generator_row(i)], self.gf)
+            plan.append((i, sources, row.mult(mat_inv).to_rows()[0]))
+
+        return plan
+
+    def repair_sources(self, lost):
+        """Returns the shards read to rebuild lost from all other shards."""
+        survivors = tuple(i for i in xrange(self.n) if i not in lost)
+        plan = self.plan_cache.get((survivors, tuple(lost)),
+                                   self.repair_plan)
+        return sorted(set(s for _, sources, _ in plan for s in sources))
+
+    def decode_data(self, shards, want=None):
+        """Rebuild the missing shards from the surviving ones.
+
+        shards: dict mapping shard index (0..n-1) to its buffer, all of the
+                same length.
+        want:   optional list of missing shard indices to rebuild, defaults
+                to all missing shards.
+        returns: dict mapping each rebuilt shard index to a bytearray.
+        """
+        for i in shards:
+            if not 0 <= i < self.n:
+                msg = 'Invalid shard index {}, must be in [0, {}).'
+                raise ValueError(msg.format(i, self.n))
+
+        length = self.ec.check_buffers(shards.values())
+        if want is None:
+            want = [i for i in xrange(self.n) if i not in shards]
+        else:
+            want = [i for i in want if i not in shards]
+        if not want:
+            return {}
+
+        plan = self.plan_cache.get((tuple(sorted(shards)), tuple(want)),
+                                   self.repair_plan)
+
+        res = {}
+        for i, sources, row in plan:
+            tbls = [self.ec.vect_tbl(c) for c in row]
+            srcs = [shards[s] for s in sources]
+            res[i] = bytearray(gf_vect.gf_vect_dot_prod(tbls, srcs, length))
+
+        return res
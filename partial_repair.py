@@ -0,0 +1,235 @@
+"""
+Repair of a lost shard by forwarding partial sums between survivor nodes.
+
+Decoding is linear, so a lost shard is the sum of c[i] times survivor
+shard i, with the coefficients c taken from the decode matrix.  Instead of
+shipping k whole shards to the repairing node, every survivor multiplies
+its own shard by its coefficient, adds the partial sums it receives from
+its children and forwards the result to its parent.  With a chain or tree
+of survivors every link carries one shard's worth of bytes, rather than the
+repairing node receiving k of them.  Shards are streamed in chunks so the
+nodes work in a pipeline.
+
+A plan is a dict mapping each survivor node to the node it forwards to,
+where the lost shard index stands for the repairing node.  repair() runs a
+plan with one local process per survivor standing in for the nodes,
+connected by pipes, and reports the bytes sent over every link.
+"""
+import multiprocessing
+import Queue
+import time
+
+import gf_vect
+
+CHUNK_SIZE = 64 << 10
+
+# Seconds to wait for the node processes to report and exit once the
+# rebuilt shard has been received
+NODE_TIMEOUT = 10
+
+
+def repair_coefficients(ec, survivors, lost):
+    """Returns the coefficient of each survivor in the lost shard.
+
+    survivors: list of k shard indices
+    lost:      index of the shard to rebuild
+    """
+    mat_inv = ec.decode_matrix(survivors)
+    if lost < ec.k:
+        return list(mat_inv[lost])
+    return ec.matrix_mult([ec.encoding_matrix[lost]], mat_inv)[0]
+
+
+def plan_star(nodes, dest):
+    """Every node sends to dest, like a plain decode at dest."""
+    return dict((node, dest) for node in nodes)
+
+
+def plan_chain(nodes, dest):
+    """Each node forwards to the next one, the last one to dest."""
+    return dict(zip(nodes, nodes[1:] + [dest]))
+
+
+def plan_tree(nodes, dest, fanout=2):
+    """Nodes form a tree with fanout children per node, rooted at dest."""
+    plan = {}
+    for i, node in enumerate(nodes):
+        plan[node] = nodes[(i - 1) // fanout] if i else dest
+    return plan
+
+
+planners = {
+    'star': plan_star,
+    'chain': plan_chain,
+    'tree': plan_tree,
+}
+
+
+def run_node(node, shard, tbl, children, parent, length, chunk_size, stats,
+             unused=()):
+    """Body of a survivor node process.
+
+    For every chunk, sends the node's own chunk times its coefficient plus
+    the partial sums received from its children to its parent.  unused are
+    the connections of the other nodes inherited when forking, which are
+    closed first so a node that dies is seen as EOF by its parent.
+    """
+    for conn in unused:
+        conn.close()
+
+    sent = 0
+    for offset in xrange(0, length, chunk_size):
+        chunk = gf_vect.as_bytes(shard[offset:offset + chunk_size])
+        size = len(chunk)
+
+        acc = 0
+        if tbl is not None:
+            acc = gf_vect.to_long(chunk.translate(tbl) if tbl else chunk)
+        for conn in children:
+            acc ^= gf_vect.to_long(conn.recv_bytes())
+
+        parent.send_bytes(gf_vect.from_long(acc, size))
+        sent += size
+
+    parent.close()
+    stats.put((node, sent))
+
+
+def repair(ec, shards, lost, plan='chain', chunk_size=CHUNK_SIZE, **kwargs):
+    """Rebuilds a lost shard with partial sums forwarded between processes.
+
+    ec:         ErasureCode the shards were encoded with
+    shards:     dict mapping survivor shard index to its buffer, at least k
+    lost:       index of the shard to rebuild
+    plan:       name of the planner to use, see planners
+    chunk_size: bytes per chunk streamed between nodes
+    kwargs:     passed to the planner, e.g. fanout for 'tree'
+
+    returns: (rebuilt shard as a bytearray, stats), where stats is a dict
+             with the bytes sent over each (node, parent) link in
+             'link_bytes', the most bytes received by one node in
+             'max_node_in_bytes' and the wall time in 'elapsed'
+
+    Raises IOError if a node process fails.
+    """
+    if len(shards) < ec.k:
+        msg = (
+            'Not enough shards to reconstruct original data. '
+            'Only {} shards received, but requires at least {} shards.'
+                .format(len(shards), ec.k)
+        )
+        raise ValueError(msg)
+    if lost in shards:
+        raise ValueError('Shard {} is not lost.'.format(lost))
+
+    length = ec.check_buffers(shards.values())
+    survivors = sorted(shards)[:ec.k]
+    coefs = dict(zip(survivors, repair_coefficients(ec, survivors, lost)))
+
+    # Survivors with a zero coefficient do not contribute
+    nodes = [s for s in survivors if coefs[s]]
+    parents = planners[plan](nodes, lost, **kwargs)
+
+    links = {}
+    children = dict((node, []) for node in nodes + [lost])
+    for node in nodes:
+        recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+        links[node] = send_conn
+        children[parents[node]].append(recv_conn)
+
+    node_conns = links.values() + [conn for node in nodes
+                                   for conn in children[node]]
+
+    stats = multiprocessing.Queue()
+    start = time.time()
+    procs = []
+    try:
+        for node in nodes:
+            own = children[node] + [links[node]]
+            proc = multiprocessing.Process(
+                target=run_node,
+                args=(node, shards[node], ec.vect_tbl(coefs[node]),
+                      children[node], links[node], length, chunk_size, stats,
+                      [conn for conn in node_conns if conn not in own] +
+                      children[lost]))
+            proc.daemon = True
+            proc.start()
+            procs.append(proc)
+
+        # Only the nodes may hold their ends of the pipes, or the repairing
+        # node would never see EOF from a node that died
+        for conn in node_conns:
+            conn.close()
+
+        # The repairing node only adds up what it receives
+        rebuilt = bytearray(length)
+        for offset in xrange(0, length, chunk_size):
+            size = min(chunk_size, length - offset)
+            acc = 0
+            for conn in children[lost]:
+                try:
+                    acc ^= gf_vect.to_long(conn.recv_bytes())
+                except EOFError:
+                    raise IOError('Repair of shard {} failed, a node exited '
+                                  'early.'.format(lost))
+            rebuilt[offset:offset + size] = gf_vect.from_long(acc, size)
+
+        try:
+            sent = dict(stats.get(timeout=NODE_TIMEOUT) for _ in nodes)
+        except Queue.Empty:
+            raise IOError('Repair of shard {} failed, a node did not report '
+                          'its stats.'.format(lost))
+    finally:
+        # Closing the receive ends makes nodes still sending fail with EPIPE
+        for conn in node_conns + children[lost]:
+            conn.close()
+        for proc in procs:
+            proc.join(NODE_TIMEOUT)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+    elapsed = time.time() - start
+
+    failed = [node for node, proc in zip(nodes, procs) if proc.exitcode]
+    if failed:
+        raise IOError('Repair of shard {} failed, nodes {} exited with an '
+                      'error.'.format(lost, failed))
+
+    link_bytes = dict(((node, parents[node]), sent[node]) for node in nodes)
+    node_in = {}
+    for (node, parent), count in link_bytes.iteritems():
+        node_in[parent] = node_in.get(parent, 0) + count
+
+    return rebuilt, {
+        'link_bytes': link_bytes,
+        'max_node_in_bytes': max(node_in.values()) if node_in else 0,
+        'elapsed': elapsed,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from erasure_code import ErasureCode
+
+    parser = argparse.ArgumentParser(
+        description='Compare repair plans for one lost shard.')
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('-p', type=int, default=4)
+    parser.add_argument('--shard-size', type=int, default=4 << 20)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--lost', type=int, default=0)
+    args = parser.parse_args()
+
+    ec = ErasureCode(args.k, args.p)
+    data = [os.urandom(args.shard_size) for _ in xrange(args.k)]
+    all_shards = dict(enumerate(data + map(str, ec.encode_data(data))))
+    shards = dict((i, s) for i, s in all_shards.iteritems() if i != args.lost)
+
+    for plan in ['star', 'chain', 'tree']:
+        rebuilt, stats = repair(ec, shards, args.lost, plan, args.chunk_size)
+        assert rebuilt == all_shards[args.lost]
+        print '{:6} {:8.3f}s  max bytes into one node {:>12}  links {}'.format(
+            plan, stats['elapsed'], stats['max_node_in_bytes'],
+            len(stats['link_bytes']))
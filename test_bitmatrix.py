@@ -0,0 +1,56 @@
+import bitmatrix
+import os
+import random
+import unittest
+
+
+class TestBitMatrixCode(unittest.TestCase):
+
+    def verify(self, k, p, length, packet_size=None):
+        code = bitmatrix.BitMatrixCode(k, p, packet_size)
+        data = [os.urandom(length) for _ in xrange(k)]
+        shards = data + map(str, code.encode_data(data))
+
+        for _ in xrange(10):
+            lost = random.sample(xrange(k + p), random.randint(1, p))
+            received = dict((i, s) for i, s in enumerate(shards)
+                            if i not in lost)
+
+            res = code.decode_data(received)
+
+            self.assertEqual(sorted(res), sorted(lost))
+            for i in lost:
+                self.assertEqual(res[i], shards[i])
+
+    def test_roundtrip(self):
+        self.verify(1, 1, 8)
+        self.verify(4, 2, 64)
+        self.verify(10, 4, 800)
+
+    def test_packets(self):
+        self.verify(4, 2, 96, packet_size=4)
+
+    def test_bit_sliced_symbols(self):
+        # Bit t of packet j of every shard forms a GF(2^8) symbol, and the
+        # parity symbols are the ErasureCode parity of the data symbols.
+        code = bitmatrix.BitMatrixCode(3, 2)
+        data = [os.urandom(16) for _ in xrange(3)]
+        shards = data + map(str, code.encode_data(data))
+
+        def symbol(shard, t):
+            packets = code.packets(shard, 16)
+            return sum(((v >> t) & 1) << j for j, v in enumerate(packets))
+
+        for t in xrange(16):
+            src = [symbol(s, t) for s in shards[:3]]
+            parity = [symbol(s, t) for s in shards[3:]]
+            self.assertEqual(code.ec.encode(src), parity)
+
+    def test_schedule_saves_xors(self):
+        code = bitmatrix.BitMatrixCode(10, 4)
+        naive = sum(max(sum(row) - 1, 0) for row in code.encode_bitmatrix)
+        self.assertLess(bitmatrix.schedule_xors(code.encode_schedule), naive)
+
+    def test_bad_length(self):
+        code = bitmatrix.BitMatrixCode(2, 1, packet_size=4)
+        self.assertRaises(ValueError, code.encode_data, ['a' * 16, 'b' * 16])
@@ -0,0 +1,89 @@
+import decode_bundle
+import erasure_code
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+class TestDecodeBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'bundle')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rank(self):
+        for idx, survivors in enumerate(
+                sorted(itertools.combinations(range(8), 3),
+                       key=lambda s: s[::-1])):
+            self.assertEqual(decode_bundle.survivors_rank(survivors), idx)
+
+    def test_matrices(self):
+        ec = erasure_code.ErasureCode(5, 3)
+        self.assertEqual(decode_bundle.write_bundle(self.path, ec), 0)
+
+        bundle = decode_bundle.DecodeBundle(self.path)
+        try:
+            self.assertTrue(bundle.matches(ec))
+            for survivors in itertools.combinations(range(8), 5):
+                self.assertEqual(bundle.decode_matrix(survivors),
+                                 ec._decode_matrix(survivors))
+        finally:
+            bundle.close()
+
+    def test_decode(self):
+        ec = erasure_code.ErasureCode(6, 3)
+        decode_bundle.write_bundle(self.path, ec)
+
+        ec = erasure_code.ErasureCode(6, 3)
+        ec.load_bundle(self.path)
+
+        data = [os.urandom(32) for _ in xrange(6)]
+        shards = data + map(str, ec.encode_data(data))
+        for _ in xrange(20):
+            lost = random.sample(xrange(9), 3)
+            received = dict((i, s) for i, s in enumerate(shards)
+                            if i not in lost)
+            res = ec.decode_data(received)
+            for i in lost:
+                self.assertEqual(res[i], shards[i])
+
+    def test_singular(self):
+        # The vandermonde matrix is not MDS for k = 6, p = 4
+        ec = erasure_code.ErasureCode(6, 4, matrix='vandermonde')
+        self.assertGreater(decode_bundle.write_bundle(self.path, ec), 0)
+
+        ec.load_bundle(self.path)
+        self.assertRaises(ValueError, ec.decode_matrix, [3, 5, 6, 7, 8, 9])
+
+    def test_too_many_sets(self):
+        ec = erasure_code.ErasureCode(32, 8)
+        self.assertRaises(ValueError, decode_bundle.write_bundle, self.path,
+                          ec)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_mismatch(self):
+        decode_bundle.write_bundle(self.path, erasure_code.ErasureCode(4, 2))
+
+        for k, p, matrix in [(4, 3, 'cauchy'), (4, 2, 'rs')]:
+            ec = erasure_code.ErasureCode(k, p, matrix=matrix)
+            self.assertRaises(ValueError, ec.load_bundle, self.path)
+
+    def test_invalid_file(self):
+        decode_bundle.write_bundle(self.path, erasure_code.ErasureCode(4, 2))
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertRaises(ValueError, decode_bundle.DecodeBundle, self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write('not a bundle' * 10)
+        self.assertRaises(ValueError, decode_bundle.DecodeBundle, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import decode_cache
+import erasure_code
+import threading
+import unittest
+
+
+class TestDecodeMatrixCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = decode_cache.DecodeMatrixCache(2)
+        computed = []
+
+        def compute(key):
+            computed.append(key)
+            return key * 2
+
+        self.assertEqual(cache.get(1, compute), 2)
+        self.assertEqual(cache.get(2, compute), 4)
+        self.assertEqual(cache.get(1, compute), 2)
+        # 2 is now the least recently used entry
+        self.assertEqual(cache.get(3, compute), 6)
+        self.assertEqual(cache.get(1, compute), 2)
+        self.assertEqual(cache.get(2, compute), 4)
+
+        self.assertEqual(computed, [1, 2, 3, 2])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['size'], 2)
+
+    def test_disabled(self):
+        cache = decode_cache.DecodeMatrixCache(0)
+        cache.get(1, lambda key: key)
+        cache.get(1, lambda key: key)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_threads(self):
+        cache = decode_cache.DecodeMatrixCache(4)
+
+        def worker():
+            for i in xrange(1000):
+                self.assertEqual(cache.get(i % 8, lambda key: key), i % 8)
+
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 4000)
+        self.assertEqual(stats['size'], 4)
+
+    def test_decode_uses_cache(self):
+        ec = erasure_code.ErasureCode(4, 2)
+        data = [1, 2, 3, 4]
+        received = data + ec.encode(data)
+        received[0] = None
+        received[2] = None
+
+        for _ in xrange(10):
+            self.assertEqual(ec.decode(received), data)
+
+        stats = ec.decode_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 9)
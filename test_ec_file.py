@@ -0,0 +1,347 @@
+import ec_file
+import erasure_code
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmpdir, 'obj')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_src(self, size):
+        data = ''.join(chr(random.getrandbits(8)) for _ in xrange(size))
+        path = os.path.join(self.tmpdir, 'src')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path, data
+
+    def read_shard(self, idx):
+        """Returns the blocks of a shard file without header and checksums."""
+        manifest = ec_file.read_manifest(self.prefix)
+        size = manifest['stripes'] * manifest['block_size']
+        with open(ec_file.shard_path(self.prefix, idx), 'rb') as f:
+            return f.read()[ec_file.HEADER_SIZE:ec_file.HEADER_SIZE + size]
+
+    def flip_byte(self, idx, offset):
+        """Inverts the byte at offset within the blocks of shard idx."""
+        with open(ec_file.shard_path(self.prefix, idx), 'r+b') as f:
+            f.seek(ec_file.HEADER_SIZE + offset)
+            byte = f.read(1)
+            f.seek(ec_file.HEADER_SIZE + offset)
+            f.write(chr(ord(byte) ^ 0xff))
+
+
+class TestEncodeFile(TempDirTestCase):
+
+    def test_encode(self):
+        k, p, bs = 4, 2, 4096
+        # Two full stripes and a partial one
+        path, data = self.write_src(2 * k * bs + 5000)
+
+        manifest = ec_file.encode_file(path, self.prefix, k, p, bs)
+
+        self.assertEqual(manifest, ec_file.read_manifest(self.prefix))
+        self.assertEqual(manifest['size'], len(data))
+        self.assertEqual(manifest['stripes'], 3)
+
+        padded = data + '\0' * (3 * k * bs - len(data))
+        shards = [self.read_shard(i) for i in xrange(k + p)]
+        ec = erasure_code.ErasureCode(k, p)
+        for s in xrange(3):
+            stripe = padded[s * k * bs:(s + 1) * k * bs]
+            blocks = [stripe[i * bs:(i + 1) * bs] for i in xrange(k)]
+            blocks += map(str, ec.encode_data(blocks))
+            for i in xrange(k + p):
+                self.assertEqual(shards[i][s * bs:(s + 1) * bs], blocks[i])
+
+    def test_empty(self):
+        path, _ = self.write_src(0)
+        manifest = ec_file.encode_file(path, self.prefix, 2, 1, 4096)
+        self.assertEqual(manifest['stripes'], 0)
+        self.assertEqual(self.read_shard(2), '')
+
+    def test_unaligned_block_size(self):
+        path, _ = self.write_src(10)
+        self.assertRaises(ValueError, ec_file.encode_file, path, self.prefix,
+                          2, 1, 1000)
+
+    def test_header(self):
+        k, p, bs = 3, 2, 4096
+        path, data = self.write_src(k * bs + 1)
+        manifest = ec_file.encode_file(path, self.prefix, k, p, bs, 'rs')
+
+        for i in xrange(k + p):
+            shard = ec_file.shard_path(self.prefix, i)
+            self.assertEqual(os.path.getsize(shard),
+                             ec_file.shard_file_size(manifest))
+            with open(shard, 'rb') as f:
+                header = ec_file.unpack_header(f.read(ec_file.HEADER_SIZE))
+            self.assertEqual(header, {
+                'k': k, 'p': p, 'index': i, 'matrix': 'rs',
+                'block_size': bs, 'stripes': 2, 'size': len(data),
+            })
+
+    def test_checksums(self):
+        k, p, bs = 2, 1, 4096
+        path, data = self.write_src(3 * k * bs)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+
+        blocks = self.read_shard(1)
+        with open(ec_file.shard_path(self.prefix, 1), 'rb') as f:
+            f.seek(ec_file.HEADER_SIZE + len(blocks))
+            crcs = struct.unpack('<3I', f.read())
+        self.assertEqual(list(crcs),
+                         [ec_file.crc(blocks[s * bs:(s + 1) * bs])
+                          for s in xrange(3)])
+
+
+class TestRestoreFile(TempDirTestCase):
+
+    def restore(self, regenerate=False):
+        dst = os.path.join(self.tmpdir, 'dst')
+        rebuilt = ec_file.restore_file(self.prefix, dst, regenerate)
+        with open(dst, 'rb') as f:
+            return f.read(), rebuilt
+
+    def test_lost_shards(self):
+        k, p, bs = 4, 2, 4096
+        path, data = self.write_src(2 * k * bs + 123)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+        orig = [self.read_shard(i) for i in xrange(k + p)]
+
+        os.remove(ec_file.shard_path(self.prefix, 1))
+        # A truncated shard is lost too
+        with open(ec_file.shard_path(self.prefix, 4), 'r+b') as f:
+            f.truncate(bs)
+
+        restored, rebuilt = self.restore()
+        self.assertEqual(restored, data)
+        self.assertEqual(rebuilt, [])
+
+        restored, rebuilt = self.restore(regenerate=True)
+        self.assertEqual(restored, data)
+        self.assertEqual(rebuilt, [1, 4])
+        for i in xrange(k + p):
+            self.assertEqual(self.read_shard(i), orig[i])
+
+    def test_corrupt_blocks(self):
+        k, p, bs = 4, 2, 4096
+        path, data = self.write_src(3 * k * bs)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+
+        # Blocks failing their checksum are treated as erasures, up to p of
+        # them per stripe
+        self.flip_byte(0, bs + 10)
+        self.flip_byte(2, bs + 20)
+        self.flip_byte(3, 2 * bs)
+        self.assertEqual(self.restore(), (data, []))
+
+        self.flip_byte(5, bs + 30)
+        self.assertRaises(ValueError, self.restore)
+
+    def test_bad_header(self):
+        k, p, bs = 2, 1, 4096
+        path, data = self.write_src(k * bs)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+        orig = self.read_shard(0)
+
+        with open(ec_file.shard_path(self.prefix, 0), 'r+b') as f:
+            f.write('garbage!')
+
+        self.assertEqual(self.restore(regenerate=True), (data, [0]))
+        self.assertEqual(self.read_shard(0), orig)
+
+    def test_not_enough_shards(self):
+        path, data = self.write_src(100)
+        ec_file.encode_file(path, self.prefix, 2, 1, 4096)
+        os.remove(ec_file.shard_path(self.prefix, 0))
+        os.remove(ec_file.shard_path(self.prefix, 2))
+
+        self.assertRaises(ValueError, self.restore)
+
+    def test_empty(self):
+        path, _ = self.write_src(0)
+        ec_file.encode_file(path, self.prefix, 2, 1, 4096)
+        os.remove(ec_file.shard_path(self.prefix, 0))
+
+        self.assertEqual(self.restore(), ('', []))
+
+
+class TestScrubFile(TempDirTestCase):
+
+    def test_scrub(self):
+        k, p, bs = 4, 2, 4096
+        path, data = self.write_src(3 * k * bs)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+
+        self.assertEqual(ec_file.scrub_file(self.prefix), [])
+
+        # Flip a byte in the second stripe of shard 2
+        self.flip_byte(2, bs + 100)
+        self.assertEqual(ec_file.scrub_file(self.prefix),
+                         [(1, 0, bs, 2)])
+
+    def test_parity_mismatch(self):
+        k, p, bs = 4, 2, 4096
+        path, data = self.write_src(2 * k * bs)
+        ec_file.encode_file(path, self.prefix, k, p, bs)
+
+        # Corrupt a block and its checksum, so only parity can catch it
+        self.flip_byte(1, bs + 7)
+        block = self.read_shard(1)[bs:2 * bs]
+        with open(ec_file.shard_path(self.prefix, 1), 'r+b') as f:
+            f.seek(ec_file.HEADER_SIZE + 2 * bs + ec_file.CRC_SIZE)
+            f.write(struct.pack(ec_file.CRC_FORMAT, ec_file.crc(block)))
+
+        self.assertEqual(ec_file.scrub_file(self.prefix),
+                         [(1, 7, 8, 1)])
+
+    def test_missing_shard(self):
+        path, data = self.write_src(100)
+        ec_file.encode_file(path, self.prefix, 2, 1, 4096)
+        os.remove(ec_file.shard_path(self.prefix, 1))
+
+        self.assertRaises(ValueError, ec_file.scrub_file, self.prefix)
+
+
+class TestResizeParity(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.k, self.bs = 4, 4096
+        self.src, self.data = self.write_src(2 * self.k * self.bs + 100)
+
+    def restore(self):
+        dst = os.path.join(self.tmpdir, 'dst')
+        ec_file.restore_file(self.prefix, dst)
+        with open(dst, 'rb') as f:
+            return f.read()
+
+    def encode_reference(self, p, matrix='cauchy'):
+        """Returns the shards of the source encoded with p parity shards."""
+        prefix = self.prefix
+        self.prefix = os.path.join(self.tmpdir, 'ref')
+        try:
+            ec_file.encode_file(self.src, self.prefix, self.k, p, self.bs,
+                                matrix)
+            return [self.read_shard(i) for i in xrange(self.k + p)]
+        finally:
+            self.prefix = prefix
+
+    def test_add(self):
+        ec_file.encode_file(self.src, self.prefix, self.k, 2, self.bs)
+        orig = [self.read_shard(i) for i in xrange(self.k + 2)]
+
+        manifest = ec_file.resize_parity(self.prefix, 4)
+
+        self.assertEqual(manifest['p'], 4)
+        self.assertEqual(manifest, ec_file.read_manifest(self.prefix))
+        shards = [self.read_shard(i) for i in xrange(self.k + 4)]
+        self.assertEqual(shards[:self.k + 2], orig)
+        self.assertEqual(shards, self.encode_reference(4))
+
+        for i in [0, 2, 3, 5]:
+            os.remove(ec_file.shard_path(self.prefix, i))
+        self.assertEqual(self.restore(), self.data)
+
+    def test_matrices(self):
+        for matrix in ['rs', 'vandermonde']:
+            ec_file.encode_file(self.src, self.prefix, self.k, 1, self.bs,
+                                matrix)
+            ec_file.resize_parity(self.prefix, 3)
+            self.assertEqual([self.read_shard(i) for i in xrange(self.k + 3)],
+                             self.encode_reference(3, matrix))
+
+    def test_add_with_lost_shards(self):
+        ec_file.encode_file(self.src, self.prefix, self.k, 2, self.bs)
+        os.remove(ec_file.shard_path(self.prefix, 1))
+        self.flip_byte(2, self.bs + 9)
+
+        ec_file.resize_parity(self.prefix, 3)
+
+        self.assertEqual(self.read_shard(6), self.encode_reference(3)[6])
+        self.assertFalse(os.path.exists(ec_file.shard_path(self.prefix, 1)))
+
+    def test_remove(self):
+        ec_file.encode_file(self.src, self.prefix, self.k, 3, self.bs)
+        orig = [self.read_shard(i) for i in xrange(self.k + 1)]
+
+        ec_file.resize_parity(self.prefix, 1)
+
+        self.assertFalse(os.path.exists(ec_file.shard_path(self.prefix, 5)))
+        self.assertFalse(os.path.exists(ec_file.shard_path(self.prefix, 6)))
+        self.assertEqual([self.read_shard(i) for i in xrange(self.k + 1)],
+                         orig)
+
+        os.remove(ec_file.shard_path(self.prefix, 2))
+        self.assertEqual(self.restore(), self.data)
+
+    def test_remove_too_many(self):
+        ec_file.encode_file(self.src, self.prefix, self.k, 2, self.bs)
+        os.remove(ec_file.shard_path(self.prefix, 0))
+        self.assertRaises(ValueError, ec_file.resize_parity, self.prefix, 0)
+        self.assertEqual(ec_file.read_manifest(self.prefix)['p'], 2)
+
+
+class TestRangeReader(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.k, self.p, self.bs = 4, 2, 4096
+        path, self.data = self.write_src(3 * self.k * self.bs - 1000)
+        ec_file.encode_file(path, self.prefix, self.k, self.p, self.bs)
+
+    def check_ranges(self, reader):
+        bs = self.bs
+        ranges = [
+            (0, 10), (5, bs), (bs - 3, 6), (bs + 1, 2 * bs),
+            (3 * bs + 10, 2 * bs), (0, len(self.data)),
+            (len(self.data) - 5, 100), (len(self.data) + 5, 10), (17, 0),
+        ]
+        for _ in xrange(20):
+            offset = random.randrange(len(self.data))
+            ranges.append((offset, random.randrange(3 * bs)))
+
+        for offset, length in ranges:
+            self.assertEqual(reader.read(offset, length),
+                             self.data[offset:offset + length])
+
+    def test_all_shards(self):
+        with ec_file.RangeReader(self.prefix) as reader:
+            self.check_ranges(reader)
+
+    def test_lost_shards(self):
+        os.remove(ec_file.shard_path(self.prefix, 1))
+        os.remove(ec_file.shard_path(self.prefix, 2))
+        with ec_file.RangeReader(self.prefix) as reader:
+            self.check_ranges(reader)
+
+    def test_corrupt_block(self):
+        self.flip_byte(3, self.bs + 50)
+        self.flip_byte(0, 2 * self.bs)
+        with ec_file.RangeReader(self.prefix) as reader:
+            self.check_ranges(reader)
+
+        # Without checksums the corruption is returned as is
+        offset = 2 * self.k * self.bs
+        with ec_file.RangeReader(self.prefix, verify=False) as reader:
+            self.assertNotEqual(reader.read(offset, 10),
+                                self.data[offset:offset + 10])
+
+    def test_not_enough_shards(self):
+        for i in xrange(self.p + 1):
+            os.remove(ec_file.shard_path(self.prefix, i))
+        self.assertRaises(ValueError, ec_file.RangeReader, self.prefix)
+
+    def test_negative_range(self):
+        with ec_file.RangeReader(self.prefix) as reader:
+            self.assertRaises(ValueError, reader.read, -1, 10)
@@ -0,0 +1,48 @@
+import ec_parallel
+import erasure_code
+import os
+import unittest
+
+
+class TestParallelErasureCode(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pec = ec_parallel.ParallelErasureCode(4, 2, workers=2)
+        cls.ec = erasure_code.ErasureCode(4, 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pec.close()
+
+    def test_encode(self):
+        # Not a multiple of the alignment, so the last range is short
+        data = [os.urandom(3 * ec_parallel.ALIGNMENT + 17) for _ in xrange(4)]
+        self.assertEqual(self.pec.encode_data(data), self.ec.encode_data(data))
+
+    def test_decode(self):
+        data = [os.urandom(2 * ec_parallel.ALIGNMENT + 5) for _ in xrange(4)]
+        shards = data + map(str, self.ec.encode_data(data))
+        received = {1: shards[1], 3: shards[3], 4: shards[4], 5: shards[5]}
+
+        res = self.pec.decode_data(received)
+
+        self.assertEqual(sorted(res), [0, 2])
+        self.assertEqual(res[0], shards[0])
+        self.assertEqual(res[2], shards[2])
+
+    def test_buffer_types(self):
+        data = [bytearray(os.urandom(ec_parallel.ALIGNMENT + 9))
+                for _ in xrange(4)]
+        expected = self.ec.encode_data(data)
+        self.assertEqual(self.pec.encode_data(data), expected)
+        self.assertEqual(self.pec.encode_data([memoryview(d) for d in data]),
+                         expected)
+
+        received = {0: memoryview(data[0]), 2: memoryview(data[2]),
+                    4: memoryview(expected[0]), 5: memoryview(expected[1])}
+        res = self.pec.decode_data(received)
+        self.assertEqual(res, {1: data[1], 3: data[3]})
+
+    def test_empty(self):
+        self.assertEqual(self.pec.encode_data([''] * 4), [bytearray()] * 2)
@@ -0,0 +1,114 @@
+import ec_stream
+import erasure_code
+import os
+import random
+import threading
+import unittest
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.ec = erasure_code.ErasureCode(4, 2)
+
+    @staticmethod
+    def ragged(data):
+        """Splits data into chunks of random sizes."""
+        pos = 0
+        while pos < len(data):
+            size = random.randint(1, 300)
+            yield data[pos:pos + size]
+            pos += size
+
+    def encode(self, data, stripe_size, depth=2):
+        # Shard chunks are reused, so copy them
+        return [(index, [str(bytearray(s)) for s in shards], size)
+                for index, shards, size in
+                ec_stream.encode_stream(self.ec, self.ragged(data),
+                                        stripe_size, depth)]
+
+    def test_encode(self):
+        data = os.urandom(1000)
+        stripes = self.encode(data, 256)
+
+        self.assertEqual([index for index, _, _ in stripes], range(4))
+        self.assertEqual([size for _, _, size in stripes], [256] * 3 + [232])
+
+        padded = data + '\0' * 24
+        for index, shards, _ in stripes:
+            stripe = padded[index * 256:(index + 1) * 256]
+            blocks = [stripe[i * 64:(i + 1) * 64] for i in xrange(4)]
+            self.assertEqual(shards,
+                             blocks + map(str, self.ec.encode_data(blocks)))
+
+    def test_roundtrip(self):
+        data = os.urandom(5000)
+        stripes = self.encode(data, 400, depth=1)
+
+        for _, shards, _ in stripes:
+            for i in random.sample(xrange(6), 2):
+                shards[i] = None
+
+        decoded = list(ec_stream.decode_stream(self.ec, iter(stripes)))
+        self.assertEqual([index for index, _ in decoded], range(13))
+        self.assertEqual(''.join(d for _, d in decoded), data)
+
+    def test_pipe(self):
+        data = os.urandom(5000)
+
+        def drop(stripes):
+            for index, shards, size in stripes:
+                shards = list(shards)
+                shards[0] = shards[2] = None
+                yield index, shards, size
+
+        # encode_stream() reuses its buffers while decode_stream() reads
+        # ahead of decoding
+        for depth in [1, 2, 4]:
+            stripes = ec_stream.encode_stream(self.ec, self.ragged(data), 400,
+                                              depth)
+            decoded = ec_stream.decode_stream(self.ec, drop(stripes), depth)
+            self.assertEqual(''.join(d for _, d in decoded), data)
+
+    def test_bad_depth(self):
+        self.assertRaises(ValueError, list, ec_stream.encode_stream(
+            self.ec, iter(['x' * 1000]), 256, depth=0))
+        self.assertRaises(ValueError, list, ec_stream.decode_stream(
+            self.ec, iter(self.encode('x' * 1000, 256)), depth=0))
+
+    def test_empty(self):
+        self.assertEqual(self.encode('', 256), [])
+
+    def test_bad_stripe_size(self):
+        self.assertRaises(ValueError, self.encode, 'abc', 250)
+
+    def test_input_error(self):
+        def chunks():
+            yield 'x' * 1000
+            raise IOError('connection reset')
+
+        stream = ec_stream.encode_stream(self.ec, chunks(), 256)
+        self.assertRaises(IOError, list, stream)
+
+    def test_early_close(self):
+        threads = threading.active_count()
+
+        stream = ec_stream.encode_stream(self.ec, iter(['x'] * 10000), 256)
+        next(stream)
+        stream.close()
+
+        for _ in xrange(50):
+            if threading.active_count() == threads:
+                break
+            threading.Event().wait(0.05)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_not_enough_chunks(self):
+        stripes = self.encode(os.urandom(256), 256)
+        stripes[0][1][:3] = [None] * 3
+        self.assertRaises(ValueError, list,
+                          ec_stream.decode_stream(self.ec, stripes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import gf_base2
+import unittest
+
+
+class TestGF2(unittest.TestCase):
+
+    def verify_field(self, m, g):
+        gf = gf_base2.gf2(m, g)
+
+        for x in xrange(gf.order):
+            for y in xrange(gf.order):
+                self.assertEqual(gf.mult(x, y), gf.long_mult(x, y))
+
+        self.assertEqual(gf.mult_inv(0), None)
+        for x in xrange(1, gf.order):
+            self.assertEqual(gf.mult(x, gf.mult_inv(x)), 1)
+
+        for x in xrange(gf.order):
+            res = 1
+            for y in xrange(2 * gf.order):
+                self.assertEqual(gf.pow(x, y), res)
+                res = gf.mult(res, x)
+
+    def test_m3(self):
+        self.verify_field(3, 11)
+
+    def test_m8_0x11b(self):
+        self.verify_field(8, 0x11b)
+
+    def test_m8_0x11d(self):
+        # Uses the ISA-L tables from coef.py
+        self.verify_field(8, 0x11d)
+
+    def test_shared_tables(self):
+        a = gf_base2.gf2(8, 283)
+        b = gf_base2.gf2(8, 283)
+        self.assertIs(a.exp_tbl, b.exp_tbl)
+
+    def test_bad_polynomial(self):
+        self.assertRaises(ValueError, gf_base2.gf2, 8, 11)
+        # x^2 + 1 = (x + 1)^2 is not irreducible
+        self.assertRaises(ValueError, gf_base2.gf2, 2, 5)
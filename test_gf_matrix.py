@@ -0,0 +1,84 @@
+import gf_matrix
+import random
+import unittest
+from gf_base2 import gf2
+
+
+def random_matrix(rows, cols):
+    return gf_matrix.GFMatrix.from_rows(
+        [[random.randint(0, 255) for _ in xrange(cols)] for _ in xrange(rows)])
+
+
+class TestGFMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.gf = gf2(8, 283)
+
+    def reference_mult(self, a, b):
+        return [[reduce(lambda x, y: x ^ y,
+                        [self.gf.mult(a[r][i], b[i][c])
+                         for i in xrange(len(b))], 0)
+                 for c in xrange(len(b[0]))]
+                for r in xrange(len(a))]
+
+    def test_mult(self):
+        a = random_matrix(5, 7)
+        b = random_matrix(7, 3)
+        expected = self.reference_mult(a.to_rows(), b.to_rows())
+
+        self.assertEqual(a.mult(b).to_rows(), expected)
+
+        out = gf_matrix.GFMatrix(5, 3)
+        self.assertIs(a.mult(b, out=out), out)
+        self.assertEqual(out.to_rows(), expected)
+
+        self.assertRaises(ValueError, b.mult, b)
+
+    def test_invert(self):
+        for n in [1, 2, 8, 32, 128]:
+            while True:
+                mat = random_matrix(n, n)
+                try:
+                    inv = mat.inverse()
+                    break
+                except ValueError:
+                    continue
+
+            self.assertEqual(mat.mult(inv), gf_matrix.GFMatrix.identity(n))
+            self.assertEqual(inv.mult(mat), gf_matrix.GFMatrix.identity(n))
+
+    def test_invert_needs_swap(self):
+        mat = gf_matrix.GFMatrix.from_rows([[0, 1], [1, 0]])
+        mat.invert()
+        self.assertEqual(mat.to_rows(), [[0, 1], [1, 0]])
+
+    def test_singular(self):
+        mat = gf_matrix.GFMatrix.from_rows([[1, 2], [2, 4]])
+        self.assertRaises(ValueError, mat.invert)
+        # Unchanged after a failed inversion
+        self.assertEqual(mat.to_rows(), [[1, 2], [2, 4]])
+
+    def test_row_ops(self):
+        mat = random_matrix(3, 4)
+        rows = mat.to_rows()
+
+        mat.swap_rows(0, 2)
+        self.assertEqual(mat.to_rows(), [rows[2], rows[1], rows[0]])
+
+        mat.scale_row(1, 7)
+        self.assertEqual(mat.to_rows()[1], [self.gf.mult(7, x) for x in rows[1]])
+
+        mat.add_scaled_row(0, 2, 3)
+        self.assertEqual(mat.to_rows()[0],
+                         [x ^ self.gf.mult(3, y) for x, y in zip(rows[2], rows[0])])
+
+    def test_submatrix(self):
+        mat = random_matrix(4, 5)
+        rows = mat.to_rows()
+
+        sub = mat.submatrix([3, 1], (1, 4))
+        self.assertEqual(sub.to_rows(), [rows[3][1:4], rows[1][1:4]])
+
+        # row() is a view into the matrix
+        mat.row(0)[:1] = '\x09'
+        self.assertEqual(mat[0, 0], 9)
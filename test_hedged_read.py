@@ -0,0 +1,61 @@
+import erasure_code
+import hedged_read
+import os
+import time
+import unittest
+
+
+class TestHedgedReader(unittest.TestCase):
+
+    def setUp(self):
+        self.ec = erasure_code.ErasureCode(4, 2)
+        self.data = [os.urandom(64) for _ in xrange(4)]
+        self.shards = self.data + map(str, self.ec.encode_data(self.data))
+
+    def read(self, backend, extra=0, hedge_after=None):
+        with hedged_read.HedgedReader(self.ec, backend, extra,
+                                      hedge_after) as reader:
+            start = time.time()
+            res = reader.read()
+            return res, time.time() - start
+
+    def test_fast_path(self):
+        backend = hedged_read.FakeShardBackend(self.shards)
+        res, _ = self.read(backend)
+        self.assertEqual(res, self.data)
+        self.assertEqual(sorted(backend.started), [0, 1, 2, 3])
+
+    def test_extra_reads(self):
+        # Shard 1 is slow, the extra read of shard 4 is decoded instead
+        backend = hedged_read.FakeShardBackend(self.shards, {1: 5})
+        res, elapsed = self.read(backend, extra=1)
+        self.assertEqual(res, self.data)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(sorted(backend.started), [0, 1, 2, 3, 4])
+
+    def test_hedge(self):
+        backend = hedged_read.FakeShardBackend(self.shards, {0: 5, 2: 5})
+        res, elapsed = self.read(backend, hedge_after=0.05)
+        self.assertEqual(res, self.data)
+        self.assertLess(elapsed, 1)
+
+        # The stragglers are cancelled
+        for _ in xrange(100):
+            if len(backend.cancelled) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(backend.cancelled), [0, 2])
+
+    def test_failures(self):
+        backend = hedged_read.FakeShardBackend(self.shards, failures=[0, 3])
+        res, _ = self.read(backend)
+        self.assertEqual(res, self.data)
+        self.assertEqual(sorted(backend.started), range(6))
+
+        backend = hedged_read.FakeShardBackend(self.shards,
+                                               failures=[0, 3, 5])
+        self.assertRaises(ValueError, self.read, backend)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import itertools
+import lrc
+import os
+import random
+import unittest
+
+
+class TestLocalReconstructionCode(unittest.TestCase):
+
+    def encode(self, code, length=64):
+        data = [os.urandom(length) for _ in xrange(code.k)]
+        return data + map(str, code.encode_data(data))
+
+    def check_decode(self, code, shards, lost):
+        received = dict((i, s) for i, s in enumerate(shards) if i not in lost)
+        res = code.decode_data(received)
+
+        self.assertEqual(sorted(res), sorted(lost))
+        for i in lost:
+            self.assertEqual(res[i], shards[i])
+
+    def test_groups(self):
+        code = lrc.LocalReconstructionCode(7, 3, 2)
+        self.assertEqual(code.groups, [[0, 1], [2, 3], [4, 5, 6]])
+        self.assertEqual(code.n, 12)
+        self.assertEqual(code.group_of(3), 1)
+        self.assertEqual(code.group_of(9), 2)
+        self.assertEqual(code.group_of(10), None)
+
+        self.assertRaises(ValueError, lrc.LocalReconstructionCode, 4, 5, 2)
+
+    def test_parity(self):
+        code = lrc.LocalReconstructionCode(6, 2, 2)
+        shards = self.encode(code)
+
+        for j, group in enumerate(code.groups):
+            local = bytearray(len(shards[0]))
+            for i in group:
+                for b, byte in enumerate(bytearray(shards[i])):
+                    local[b] ^= byte
+            self.assertEqual(shards[code.k + j], local)
+
+        # Global parities are those of the underlying code
+        self.assertEqual(shards[code.k + code.l:],
+                         map(str, code.ec.encode_data(shards[:code.k])))
+
+    def test_local_repair(self):
+        code = lrc.LocalReconstructionCode(12, 2, 2)
+        shards = self.encode(code)
+
+        for i in xrange(code.k + code.l):
+            j = code.group_of(i)
+            self.assertEqual(code.repair_sources([i]),
+                             [m for m in code.group_members(j) if m != i])
+            self.check_decode(code, shards, [i])
+
+        # One loss in each group is still repaired locally
+        self.assertEqual(len(code.repair_sources([0, 6])), 12)
+        self.check_decode(code, shards, [0, 6])
+
+    def test_global_repair(self):
+        code = lrc.LocalReconstructionCode(6, 2, 2)
+        shards = self.encode(code)
+
+        self.assertEqual(len(code.repair_sources([code.n - 1])), code.k)
+
+        # With the cauchy matrix every pattern of g + 1 losses is recoverable
+        for lost in itertools.combinations(xrange(code.n), code.g + 1):
+            self.check_decode(code, shards, list(lost))
+
+        for lost in [[0, 1, 3, 4], [0, 1, 3, 6], [0, 3, 8, 9]]:
+            self.check_decode(code, shards, lost)
+
+    def test_unrecoverable(self):
+        code = lrc.LocalReconstructionCode(6, 2, 1)
+        shards = self.encode(code)
+
+        # Three data losses in one group leave only two equations for them
+        lost = [0, 1, 2]
+        received = dict((i, s) for i, s in enumerate(shards) if i not in lost)
+        self.assertRaises(ValueError, code.decode_data, received)
+
+    def test_random(self):
+        # Any g losses are recoverable whatever the global matrix
+        code = lrc.LocalReconstructionCode(10, 2, 2, matrix='rs')
+        shards = self.encode(code, 100)
+        for _ in xrange(20):
+            self.check_decode(code, shards,
+                              random.sample(xrange(code.n), code.g))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import erasure_code
+from gf_base2 import gf2
+from gf_matrix import GFMatrix
+import itertools
+import mds
+import random
+import unittest
+
+
+class TestMDS(unittest.TestCase):
+
+    def setUp(self):
+        self.gf = gf2(8, 283)
+
+    def singular(self, a, rows, cols):
+        mat = GFMatrix.from_rows([[a[r][c] for c in cols] for r in rows],
+                                 self.gf)
+        try:
+            mat.invert()
+        except ValueError:
+            return True
+        return False
+
+    def brute_force(self, a):
+        """Returns the size of the smallest singular minor, or None."""
+        p, k = len(a), len(a[0])
+        for t in xrange(1, min(p, k) + 1):
+            for rows in itertools.combinations(range(p), t):
+                for cols in itertools.combinations(range(k), t):
+                    if self.singular(a, rows, cols):
+                        return t
+        return None
+
+    def test_colex_unrank(self):
+        for t in xrange(1, 4):
+            subsets = sorted(itertools.combinations(range(7), t),
+                             key=lambda s: s[::-1])
+            for idx, subset in enumerate(subsets):
+                self.assertEqual(mds.colex_unrank(idx, t), list(subset))
+
+    def test_cauchy_params(self):
+        ec = erasure_code.ErasureCode(10, 4)
+        x, y = mds.cauchy_params(ec.gf, ec.encoding_matrix[10:])
+        for i, row in enumerate(ec.encoding_matrix[10:]):
+            for j, e in enumerate(row):
+                self.assertEqual(e, ec.gf.mult_inv(x[i] ^ y[j]))
+
+        ec = erasure_code.ErasureCode(10, 4, matrix='rs')
+        self.assertEqual(mds.cauchy_params(ec.gf, ec.encoding_matrix[10:]),
+                         None)
+
+    def test_matches_brute_force(self):
+        for _ in xrange(30):
+            p, k = random.randint(1, 3), random.randint(1, 5)
+            # Small elements make singular minors likely
+            a = [[random.randint(0, 3) for _ in xrange(k)] for _ in xrange(p)]
+
+            res = mds.find_singular_minor(self.gf, a)
+            expected = self.brute_force(a)
+            if expected is None:
+                self.assertEqual(res, None)
+            else:
+                rows, cols = res
+                self.assertEqual(len(rows), expected)
+                self.assertTrue(self.singular(a, rows, cols))
+
+    def test_validate(self):
+        self.assertEqual(mds.validate_mds(16, 4), ('cauchy', None))
+        self.assertEqual(mds.validate_mds(12, 4, structural=False),
+                         ('minors', None))
+
+        method, (rows, cols) = mds.validate_mds(32, 8, 'rs')
+        self.assertEqual(method, 'minors')
+        ec = erasure_code.ErasureCode(32, 8, matrix='rs')
+        self.assertTrue(self.singular(ec.encoding_matrix[32:], rows, cols))
+
+        # The witness is an erasure pattern that cannot be decoded
+        survivors = [i for i in xrange(32) if i not in cols]
+        survivors += [32 + r for r in rows]
+        self.assertRaises(ValueError, ec.decode_matrix, survivors)
+
+    def test_workers(self):
+        ec = erasure_code.ErasureCode(20, 4, matrix='rs')
+        a = ec.encoding_matrix[20:]
+        self.assertEqual(mds.find_singular_minor(self.gf, a, workers=2),
+                         mds.find_singular_minor(self.gf, a))
+
+
+if __name__ == '__main__':
+    unittest.main()
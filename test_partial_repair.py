@@ -0,0 +1,86 @@
+import erasure_code
+import gf_vect
+import os
+import partial_repair
+import unittest
+
+
+class FailingShard(str):
+    """Shard whose node fails when it reads the shard."""
+
+    def __getslice__(self, i, j):
+        raise IOError('Failed to read shard')
+
+
+class TestPartialRepair(unittest.TestCase):
+
+    def setUp(self):
+        self.ec = erasure_code.ErasureCode(6, 3)
+        data = [os.urandom(1000) for _ in xrange(6)]
+        self.shards = data + map(str, self.ec.encode_data(data))
+
+    def survivors(self, lost):
+        return dict((i, s) for i, s in enumerate(self.shards) if i != lost)
+
+    def test_plans(self):
+        nodes = [1, 2, 3, 4, 5]
+        self.assertEqual(partial_repair.plan_star(nodes, 0),
+                         {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+        self.assertEqual(partial_repair.plan_chain(nodes, 0),
+                         {1: 2, 2: 3, 3: 4, 4: 5, 5: 0})
+        self.assertEqual(partial_repair.plan_tree(nodes, 0),
+                         {1: 0, 2: 1, 3: 1, 4: 2, 5: 2})
+        self.assertEqual(partial_repair.plan_tree(nodes, 0, fanout=4),
+                         {1: 0, 2: 1, 3: 1, 4: 1, 5: 1})
+
+    def test_coefficients(self):
+        survivors = [0, 2, 3, 4, 6, 8]
+        for lost in [1, 7]:
+            coefs = partial_repair.repair_coefficients(self.ec, survivors,
+                                                       lost)
+            tbls = [self.ec.vect_tbl(c) for c in coefs]
+            srcs = [self.shards[i] for i in survivors]
+            self.assertEqual(
+                gf_vect.gf_vect_dot_prod(tbls, srcs, 1000),
+                self.shards[lost])
+
+    def test_repair(self):
+        for plan in sorted(partial_repair.planners):
+            for lost in [0, 4, 7]:
+                rebuilt, stats = partial_repair.repair(
+                    self.ec, self.survivors(lost), lost, plan, chunk_size=300)
+                self.assertEqual(rebuilt, self.shards[lost])
+
+                # Every link carries one shard's worth of bytes
+                self.assertEqual(set(stats['link_bytes'].values()),
+                                 set([1000]))
+                self.assertEqual(len(stats['link_bytes']), 6)
+
+    def test_node_bytes(self):
+        max_in = {}
+        for plan in ['star', 'chain', 'tree']:
+            _, stats = partial_repair.repair(self.ec, self.survivors(2), 2,
+                                             plan)
+            max_in[plan] = stats['max_node_in_bytes']
+        self.assertEqual(max_in, {'star': 6000, 'chain': 1000, 'tree': 2000})
+
+    def test_errors(self):
+        shards = self.survivors(0)
+        self.assertRaises(ValueError, partial_repair.repair, self.ec,
+                          shards, 1)
+        for i in [1, 2, 3]:
+            del shards[i]
+        self.assertRaises(ValueError, partial_repair.repair, self.ec,
+                          shards, 0)
+
+    def test_node_failure(self):
+        for plan in sorted(partial_repair.planners):
+            for failing in [1, 5]:
+                shards = self.survivors(0)
+                shards[failing] = FailingShard(shards[failing])
+                self.assertRaises(IOError, partial_repair.repair, self.ec,
+                                  shards, 0, plan, chunk_size=300)
+
+
+if __name__ == '__main__':
+    unittest.main()